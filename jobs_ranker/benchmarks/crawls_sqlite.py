@@ -0,0 +1,107 @@
+"""
+sqlite crawls reading benchmark on synthetic job-ads crawls: reads a crawl file
+with CrawlsFilesDao (parsing the csv), with the previous sqlite storage of the rows
+as json (parsed per row) and with CrawlsSqliteDao (a table per crawl), reports
+the times and checks that the read crawls are identical.
+
+usage: python -m jobs_ranker.benchmarks.crawls_sqlite --sizes 2000 20000
+"""
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import pandas as pd
+
+from jobs_ranker.benchmarks.synthetic import SyntheticJobAds
+from jobs_ranker.scraping.crawling import CrawlsFilesDao, CrawlsSqliteDao
+from jobs_ranker.utils.logger import logger
+
+
+def json_rows_read(df, path, db_path):
+    """ previous storage of the rows as json (reference), :return: read seconds """
+    conn = sqlite3.connect(db_path)
+    with conn:
+        conn.execute('CREATE TABLE jobs (row INTEGER PRIMARY KEY, data TEXT NOT NULL)')
+        conn.executemany('INSERT INTO jobs (row, data) VALUES (?, ?)',
+                         ((i, json.dumps(record))
+                          for i, record in enumerate(df.to_dict('records'))))
+    start = time.time()
+    records = conn.execute('SELECT data FROM jobs ORDER BY row').fetchall()
+    CrawlsFilesDao._prepare_scraped(
+        pd.DataFrame([json.loads(record[0]) for record in records]), path)
+    seconds = time.time() - start
+    conn.close()
+    return seconds
+
+
+def run_one(size, seed=0):
+    df = SyntheticJobAds(seed=seed).corpus(size).drop(columns=['dup_group'])
+    df['depth'] = np.arange(size) % 7
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        # crawls are in a directory per task
+        path = os.path.join(temp_dir, 'benchmark', '2020-01-01.csv')
+        os.makedirs(os.path.dirname(path))
+        df.to_csv(path, index=False)
+        CrawlsSqliteDao.db_path = os.path.join(temp_dir, 'crawls.sqlite')
+
+        start = time.time()
+        CrawlsSqliteDao.rows_in_file(path)
+        import_seconds = time.time() - start
+
+        start = time.time()
+        from_csv = CrawlsFilesDao.read_scrapy_file(path)
+        csv_seconds = time.time() - start
+
+        start = time.time()
+        from_sqlite = CrawlsSqliteDao.read_scrapy_file(path)
+        sqlite_seconds = time.time() - start
+
+        json_seconds = json_rows_read(
+            pd.read_csv(path), path, os.path.join(temp_dir, 'json.sqlite'))
+
+    pd.testing.assert_frame_equal(from_csv, from_sqlite)
+
+    return {
+        'size': size,
+        'import_seconds': round(import_seconds, 3),
+        'csv_seconds': round(csv_seconds, 3),
+        'json_rows_seconds': round(json_seconds, 3),
+        'sqlite_seconds': round(sqlite_seconds, 3),
+        'speedup_vs_json': round(json_seconds / max(sqlite_seconds, 1e-6), 1),
+    }
+
+
+def run_benchmark(sizes, seed=0):
+    results = []
+    for size in sizes:
+        result = run_one(size, seed)
+        logger.info(f'sqlite crawls benchmark: {result}')
+        results.append(result)
+    return pd.DataFrame(results)
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2000, 20000],
+                        help='numbers of rows in the crawl')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default='',
+                        help='optional path of a csv file to save the results to')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = run_benchmark(sizes=args.sizes, seed=args.seed)
+    logger.info(f'sqlite crawls benchmark results (identical crawls):\n{results}')
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""
+deduplication scaling and accuracy benchmark on synthetic job-ads corpora.
+for each corpus size, dedup method and threshold reports wall time, peak RSS
+and precision / recall of the duplicate pairs w.r.t the planted duplicates.
+
+usage: python -m jobs_ranker.benchmarks.dedup --sizes 1000 10000 --thresholds 0.3 0.5
+"""
+import resource
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from jobs_ranker.benchmarks.synthetic import SyntheticJobAds
+from jobs_ranker.config import common
+from jobs_ranker.ml import deduplication
+from jobs_ranker.utils.logger import logger
+
+
+def _pairs_set(pairs_i, pairs_j):
+    pairs_i, pairs_j = np.asarray(pairs_i), np.asarray(pairs_j)
+    upper = pairs_i < pairs_j
+    return set(zip(pairs_i[upper].tolist(), pairs_j[upper].tolist()))
+
+
+def true_duplicate_pairs(dup_groups):
+    dup_groups = np.asarray(dup_groups)
+    codes = deduplication._pairs_codes_within_groups(dup_groups, len(dup_groups))
+    return set(zip((codes // len(dup_groups)).tolist(),
+                   (codes % len(dup_groups)).tolist()))
+
+
+def precision_recall(found, true):
+    hits = len(found & true)
+    precision = hits / len(found) if found else 1.0
+    recall = hits / len(true) if true else 1.0
+    return precision, recall
+
+
+def run_one(size, method, threshold, n_jobs=1, dup_ratio=0.2, seed=0):
+    """
+    runs a single configuration, meant to be run in a fresh process for
+    the peak RSS to be meaningful
+    """
+    df = SyntheticJobAds(seed=seed).corpus(size, dup_ratio=dup_ratio)
+
+    common.MLParams.dedup_method = method
+    common.MLParams.dedup_simil_thershold = threshold
+    common.MLParams.dedup_n_jobs = n_jobs
+
+    start = time.time()
+    found = _pairs_set(*deduplication._dedup_method()(df['description'].values))
+    elapsed = time.time() - start
+
+    precision, recall = precision_recall(found, true_duplicate_pairs(df['dup_group']))
+    return {
+        'size': size,
+        'method': method,
+        'threshold': threshold,
+        'n_jobs': n_jobs,
+        'seconds': round(elapsed, 2),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024,
+        'found_pairs': len(found),
+        'precision': round(precision, 4),
+        'recall': round(recall, 4),
+    }
+
+
+def run_benchmark(sizes, methods, thresholds, n_jobs=1, dup_ratio=0.2, seed=0):
+    results = []
+    for size in sizes:
+        for method in methods:
+            for threshold in thresholds:
+                # fresh process per run for peak memory measurement
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    result = pool.submit(run_one, size, method, threshold,
+                                         n_jobs, dup_ratio, seed).result()
+                logger.info(f'dedup benchmark: {result}')
+                results.append(result)
+    return pd.DataFrame(results)
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+                        help='corpus sizes (number of ads)')
+    parser.add_argument('--methods', type=str, nargs='+',
+                        default=['tfidf_cosine', 'minhash_lsh'],
+                        help='dedup methods (MLParams.dedup_method values)')
+    parser.add_argument('--thresholds', type=float, nargs='+',
+                        default=[common.MLParams.dedup_simil_thershold],
+                        help='similarity thresholds')
+    parser.add_argument('--n-jobs', type=int, default=1,
+                        help='worker processes for tfidf_cosine')
+    parser.add_argument('--dup-ratio', type=float, default=0.2,
+                        help='approximate fraction of planted duplicates')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default='',
+                        help='optional path of a csv file to save the results to')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = run_benchmark(sizes=args.sizes,
+                            methods=args.methods,
+                            thresholds=args.thresholds,
+                            n_jobs=args.n_jobs,
+                            dup_ratio=args.dup_ratio,
+                            seed=args.seed)
+    logger.info(f'dedup benchmark results:\n{results}')
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
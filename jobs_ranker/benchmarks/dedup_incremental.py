@@ -0,0 +1,167 @@
+"""
+incremental dedup benchmark on synthetic job-ads crawls with vocabulary drift:
+the later crawls have terms that are not in the first crawl (also shared between
+unrelated ads), and some unrelated ads share only a boilerplate footer that is
+in the first crawl. The crawls are added one by one to a DedupIndex (fitted on
+the first crawl), and the found pairs are compared to a full recompute.
+
+checks (AssertionError otherwise) that the ads that share only the footer aren't
+matched, and that the pairs that differ from the full recompute are borderline
+(their exact similarity is within max_margin of the threshold) - these are due
+to the idf weights of the index not being refitted on the later crawls.
+
+usage: python -m jobs_ranker.benchmarks.dedup_incremental --sizes 2000 10000
+"""
+import os
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import pandas as pd
+
+from jobs_ranker.benchmarks.dedup import _pairs_set
+from jobs_ranker.benchmarks.synthetic import SyntheticJobAds
+from jobs_ranker.config import common
+from jobs_ranker.ml import deduplication
+from jobs_ranker.utils.logger import logger
+
+_FOOTER = ('all applicants must have full working rights, to apply please send '
+           'your resume to our recruitment team quoting the job reference')
+
+
+def drift_crawls(size, n_crawls, n_boilerplate, dup_ratio=0.2, seed=0):
+    """
+    :return: (strings, crawls, boilerplate) - descriptions, crawl number of each
+        description, and the indices of the unrelated ads that share only the footer
+    """
+    rand = np.random.RandomState(seed)
+    df = SyntheticJobAds(seed=seed).corpus(size, dup_ratio=dup_ratio)
+    strings = df['description'].values.astype(object)
+    crawls = np.arange(size) * n_crawls // size
+    for crawl in range(1, n_crawls):
+        # new terms of the crawl, the same for the duplicates in the crawl
+        new_terms = np.array([f'newterm{crawl}x{i}' for i in range(size // 20)])
+        for group in np.unique(df['dup_group'].values[crawls == crawl]):
+            rows = np.flatnonzero((crawls == crawl) & (df['dup_group'].values == group))
+            sentence = 'now also using ' + ' and '.join(rand.choice(new_terms, 4))
+            strings[rows] = strings[rows] + '\n' + sentence
+
+    # ads in the first crawl with the footer, and unrelated ads that only share it
+    # (and new terms) in the later crawls
+    strings[:n_boilerplate] = strings[:n_boilerplate] + '\n' + _FOOTER
+    crawl_rows = [np.flatnonzero(crawls == crawl) for crawl in range(n_crawls)]
+    noise_terms = np.array([f'noiseterm{i}' for i in range(size)])
+    boilerplate = []
+    for crawl in range(1, n_crawls):
+        rows = crawl_rows[crawl][:n_boilerplate]
+        strings[rows] = [' '.join(rand.choice(noise_terms, 60)) + '\n' + _FOOTER
+                         for _ in rows]
+        boilerplate.extend(rows)
+    return strings.astype(str), crawls, np.array(boilerplate)
+
+
+def run_one(size, n_crawls, n_boilerplate, max_margin, dup_ratio=0.2, seed=0):
+    strings, crawls, boilerplate = drift_crawls(
+        size, n_crawls, n_boilerplate, dup_ratio=dup_ratio, seed=seed)
+    keys = np.arange(size).astype(str)
+    threshold = common.MLParams.dedup_simil_thershold
+
+    start = time.time()
+    full = _pairs_set(*deduplication.similar_pairs(deduplication._tfidf_vectors(strings)))
+    full_seconds = time.time() - start
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        index = deduplication.DedupIndex(os.path.join(temp_dir, 'index.pkl'))
+        for crawl in range(n_crawls):
+            start = time.time()
+            end = np.flatnonzero(crawls == crawl)[-1] + 1
+            index.update(keys[:end], strings[:end])
+            last_update_seconds = time.time() - start
+        incremental = _pairs_set(*index.duplicates(keys))
+
+    vecs = deduplication._tfidf_vectors(strings)
+
+    def exact_similarities(pairs):
+        pairs = np.array(sorted(pairs), dtype=np.int64).reshape(-1, 2)
+        return deduplication.rows_cosine_similarity(vecs, pairs[:, 0], pairs[:, 1])
+
+    spurious, missed = incremental - full, full - incremental
+    margin = np.abs(np.concatenate([exact_similarities(spurious),
+                                    exact_similarities(missed)]) - threshold)
+    boilerplate_set = set(boilerplate.tolist())
+    boilerplate_pairs = [(i, j) for i, j in incremental
+                         if i in boilerplate_set or j in boilerplate_set]
+
+    result = {
+        'size': size,
+        'crawls': n_crawls,
+        'full_seconds': round(full_seconds, 2),
+        'last_crawl_seconds': round(last_update_seconds, 2),
+        'full_pairs': len(full),
+        'incremental_pairs': len(incremental),
+        'spurious': len(spurious),
+        'missed': len(missed),
+        'pairs_jaccard': round(len(full & incremental) / max(len(full | incremental), 1), 4),
+        'max_margin': round(margin.max(), 4) if len(margin) else 0.0,
+        'boilerplate_pairs': len(boilerplate_pairs),
+    }
+    if boilerplate_pairs:
+        raise AssertionError(f'unrelated ads with a shared footer matched: '
+                             f'{boilerplate_pairs[:10]}')
+    if result['max_margin'] > max_margin:
+        raise AssertionError(f'pairs that differ from the full recompute are not borderline: '
+                             f'similarity margin {result["max_margin"]} > {max_margin}')
+    return result
+
+
+def run_benchmark(sizes, n_crawls, n_boilerplate, max_margin, refit_ratio=None,
+                  dup_ratio=0.2, seed=0):
+    # by default only the first crawl is fitted
+    common.MLParams.dedup_index_refit_ratio = refit_ratio or n_crawls
+    common.MLParams.dedup_method = 'tfidf_cosine'
+    results = []
+    for size in sizes:
+        result = run_one(size, n_crawls, n_boilerplate, max_margin, dup_ratio, seed)
+        logger.info(f'incremental dedup benchmark: {result}')
+        results.append(result)
+    return pd.DataFrame(results)
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2000, 10000],
+                        help='corpus sizes (number of ads in all crawls)')
+    parser.add_argument('--crawls', type=int, default=4,
+                        help='number of crawls the corpus is split into')
+    parser.add_argument('--boilerplate', type=int, default=10,
+                        help='number of unrelated ads with the shared footer per crawl')
+    parser.add_argument('--max-margin', type=float, default=0.06,
+                        help='maximal distance from the threshold of the exact '
+                             'similarity of pairs that differ from the full recompute')
+    parser.add_argument('--refit-ratio', type=float, default=None,
+                        help='dedup_index_refit_ratio, default no refit after the first crawl')
+    parser.add_argument('--dup-ratio', type=float, default=0.2,
+                        help='approximate fraction of planted duplicates')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default='',
+                        help='optional path of a csv file to save the results to')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = run_benchmark(sizes=args.sizes,
+                            n_crawls=args.crawls,
+                            n_boilerplate=args.boilerplate,
+                            max_margin=args.max_margin,
+                            refit_ratio=args.refit_ratio,
+                            dup_ratio=args.dup_ratio,
+                            seed=args.seed)
+    logger.info(f'incremental dedup benchmark results (within tolerance):\n{results}')
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
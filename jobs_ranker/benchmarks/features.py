@@ -0,0 +1,115 @@
+"""
+features extraction benchmark on synthetic job-ads: times the vectorized
+features extraction against the previous row-wise implementation, and
+checks that the outputs are equal.
+
+usage: python -m jobs_ranker.benchmarks.features --size 30000
+"""
+import re
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import pandas as pd
+
+from jobs_ranker.benchmarks.synthetic import SyntheticJobAds
+from jobs_ranker.joblist import features
+from jobs_ranker.utils.logger import logger
+
+
+def _extract_numeric_fields_on_row(row):
+    # reference row-wise implementation (previously used with df.apply(.., axis=1))
+    row['description'] = (
+        str(row['description']).lower().
+            replace('\n', ' ').replace('\t', ' '))
+
+    row['description_length'] = len(row['description'])
+
+    # salary
+    sal_str = str(row['salary'])
+    sal_nums = re.findall('[0-9]+', sal_str.replace(',', ''))
+    sal_mult = (('year' in sal_str) * 1
+                + ('day' in sal_str) * 200
+                + ('hour' in sal_str) * 1600)
+    if len(sal_nums) == 2:
+        row['salary_low'] = float(sal_nums[0]) * sal_mult
+        row['salary_high'] = float(sal_nums[1]) * sal_mult
+
+    # date
+    date_str = str(row['date'])
+    date_nums = re.findall('[0-9]+', date_str)
+    date_mult = (('day' in date_str) * 1
+                 + ('month' in date_str) * 30
+                 + ('hour' in date_str) * 0.04)
+    if len(date_nums) == 1:
+        row['days_age'] = int(int(date_nums[0]) * date_mult)
+    return row
+
+
+def _extract_year_experience(df, col_name='years_exp_max'):
+    # reference implementation (previously ran after the row-wise extraction)
+    years_regexp = re.compile(r'(?P<years>\d+)\s*years')
+    df.loc[:, col_name] = (df['description'].str.extractall(years_regexp)
+                           .groupby(level=0)['years'].apply(list)
+                           .apply(lambda l: min([int(el) for el in l])))
+    df.loc[df[col_name] >= 12, col_name] = 0
+    df.loc[df[col_name].isna(), col_name] = 0
+    return df
+
+
+def _extract_numeric_fields_reference(df):
+    return _extract_year_experience(df.apply(_extract_numeric_fields_on_row, axis=1))
+
+
+def assert_frames_equal(expected, actual, columns):
+    for col in columns:
+        exp, act = expected[col], actual[col]
+        if exp.dtype == object and isinstance(exp.dropna().iloc[0], str):
+            equal = (exp.fillna('') == act.fillna('')).all()
+        else:
+            equal = np.allclose(exp.astype(float), act.astype(float), equal_nan=True)
+        if not equal:
+            raise AssertionError(f'column "{col}" differs from reference implementation')
+
+
+def _timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return result, time.time() - start
+
+
+def benchmark_numeric_fields(df):
+    expected, ref_time = _timed(_extract_numeric_fields_reference, df.copy())
+    actual, vec_time = _timed(features.extract_numeric_fields, df.copy())
+    assert_frames_equal(expected, actual, columns=[
+        'description', 'description_length', 'salary_low', 'salary_high', 'days_age',
+        'years_exp_max'])
+    return {'stage': 'numeric_fields', 'rows': len(df),
+            'reference_seconds': round(ref_time, 3),
+            'vectorized_seconds': round(vec_time, 3),
+            'speedup': round(ref_time / max(vec_time, 1e-6), 1)}
+
+
+def run_benchmark(size, seed=0):
+    df = SyntheticJobAds(seed=seed).corpus(size)
+    # scraped descriptions can be missing
+    df.loc[df.sample(frac=0.01, random_state=seed).index, 'description'] = np.nan
+    return pd.DataFrame([benchmark_numeric_fields(df)])
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--size', type=int, default=30000,
+                        help='number of synthetic ads')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = run_benchmark(size=args.size, seed=args.seed)
+    logger.info(f'features benchmark results (outputs are equal):\n{results}')
+
+
+if __name__ == '__main__':
+    main()
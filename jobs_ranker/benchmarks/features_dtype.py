@@ -0,0 +1,144 @@
+"""
+features dtype benchmark on synthetic job-ads: runs the tfidf cosine dedup
+and the ranking regression pipeline with float64 and with float32 features,
+reports time, peak RSS and features matrices sizes, and checks that the
+duplicate pairs and the rankings of the float32 run are the same as the
+float64 ones (within tolerance).
+
+usage: python -m jobs_ranker.benchmarks.features_dtype --sizes 2000 10000
+"""
+import resource
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import scipy.stats
+
+from jobs_ranker.benchmarks.dedup import _pairs_set
+from jobs_ranker.benchmarks.synthetic import SyntheticJobAds
+from jobs_ranker.benchmarks.text_features import synthetic_relevance
+from jobs_ranker.config import common
+from jobs_ranker.joblist import features
+from jobs_ranker.ml import deduplication, regression
+from jobs_ranker.utils.logger import logger
+
+DTYPES = ['float64', 'float32']
+
+
+def _matrix_mb(matrix):
+    return round(sum(getattr(matrix, part).nbytes
+                     for part in ['data', 'indices', 'indptr']) / 2 ** 20, 1)
+
+
+def run_one(size, dtype, max_n_estimators, dup_ratio=0.2, seed=0):
+    """
+    runs a single configuration, meant to be run in a fresh process for
+    the peak RSS to be meaningful
+    :return: results dict, duplicate pairs set and ranking scores
+    """
+    df = features.extract_numeric_fields(
+        SyntheticJobAds(seed=seed).corpus(size, dup_ratio=dup_ratio))
+    df['relevance'] = synthetic_relevance(df, seed=seed)
+
+    common.MLParams.features_dtype = dtype
+    common.MLParams.dedup_method = 'tfidf_cosine'
+    common.MLParams.lgbm_max_n_estimators = max_n_estimators
+
+    start = time.time()
+    vecs = deduplication._tfidf_vectors(df['description'].values)
+    pairs = _pairs_set(*deduplication.similar_pairs(vecs))
+    dedup_seconds = time.time() - start
+
+    pipe = regression.LGBRegressionPipeline(
+        text_cols=['description', 'title'], num_cols=['days_age'])
+    start = time.time()
+    metrics, _ = pipe.train_eval(df, y_col='relevance', target_name=dtype)
+    scores = pipe.predict(df)
+    ranking_seconds = time.time() - start
+
+    result = {
+        'size': size,
+        'dtype': dtype,
+        'dedup_seconds': round(dedup_seconds, 2),
+        'dedup_matrix_mb': _matrix_mb(vecs),
+        'ranking_seconds': round(ranking_seconds, 2),
+        'ranking_matrix_mb': _matrix_mb(pipe.transformer.transform(df)),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024,
+        'found_pairs': len(pairs),
+        **{k: round(v, 4) for k, v in metrics.items()},
+    }
+    return result, pairs, scores
+
+
+def compare_to_reference(pairs, scores, ref_pairs, ref_scores,
+                         min_pairs_jaccard, min_rank_correlation):
+    """ :return: agreement measures, raises AssertionError if out of tolerance """
+    union = pairs | ref_pairs
+    pairs_jaccard = len(pairs & ref_pairs) / len(union) if union else 1.0
+    rank_correlation = scipy.stats.spearmanr(scores, ref_scores)[0]
+    if pairs_jaccard < min_pairs_jaccard:
+        raise AssertionError(f'duplicate pairs differ from float64: '
+                             f'jaccard {pairs_jaccard:.4f} < {min_pairs_jaccard}')
+    if rank_correlation < min_rank_correlation:
+        raise AssertionError(f'rankings differ from float64: spearman '
+                             f'{rank_correlation:.4f} < {min_rank_correlation}')
+    return {'pairs_jaccard': round(pairs_jaccard, 4),
+            'rank_correlation': round(rank_correlation, 4)}
+
+
+def run_benchmark(sizes, max_n_estimators, min_pairs_jaccard, min_rank_correlation,
+                  dup_ratio=0.2, seed=0):
+    results = []
+    for size in sizes:
+        reference = None
+        for dtype in DTYPES:
+            # fresh process per run for peak memory measurement
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                result, pairs, scores = pool.submit(
+                    run_one, size, dtype, max_n_estimators, dup_ratio, seed).result()
+            if reference is None:
+                reference = pairs, scores
+            else:
+                result.update(compare_to_reference(
+                    pairs, scores, *reference,
+                    min_pairs_jaccard=min_pairs_jaccard,
+                    min_rank_correlation=min_rank_correlation))
+            logger.info(f'features dtype benchmark: {result}')
+            results.append(result)
+    return pd.DataFrame(results)
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2000, 10000],
+                        help='corpus sizes (number of ads)')
+    parser.add_argument('--max-n-estimators', type=int, default=200,
+                        help='maximum number of boosting rounds')
+    parser.add_argument('--min-pairs-jaccard', type=float, default=0.999,
+                        help='minimal overlap of float32 and float64 duplicate pairs')
+    parser.add_argument('--min-rank-correlation', type=float, default=0.99,
+                        help='minimal spearman of float32 and float64 ranking scores')
+    parser.add_argument('--dup-ratio', type=float, default=0.2,
+                        help='approximate fraction of planted duplicates')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default='',
+                        help='optional path of a csv file to save the results to')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = run_benchmark(sizes=args.sizes,
+                            max_n_estimators=args.max_n_estimators,
+                            min_pairs_jaccard=args.min_pairs_jaccard,
+                            min_rank_correlation=args.min_rank_correlation,
+                            dup_ratio=args.dup_ratio,
+                            seed=args.seed)
+    logger.info(f'features dtype benchmark results (within tolerance):\n{results}')
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
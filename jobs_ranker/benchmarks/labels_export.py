@@ -0,0 +1,117 @@
+"""
+dedup-aware labels export benchmark on synthetic job-ads: exports labels of
+a fraction of a corpus (with planted duplicates) keeping the last label of each
+duplicates group, with the previous per-url loop and with LabeledJobs.export_df,
+reports the times and checks that the exported labels are identical.
+
+usage: python -m jobs_ranker.benchmarks.labels_export --sizes 1000 10000
+"""
+import tempfile
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+import pandas as pd
+
+from jobs_ranker.benchmarks.synthetic import SyntheticJobAds
+from jobs_ranker.joblist import labeled
+from jobs_ranker.ml.deduplication import DuplicatesGroups
+from jobs_ranker.utils.logger import logger
+
+
+def loop_dedup(df, dup_groups, url_col='url'):
+    """ previous implementation of the dedup in export_df (reference) """
+    all_urls = df[url_col].values
+    for url in all_urls:
+        dup_urls = dup_groups.urls_with_dups(url)
+        if (len(dup_urls) >= 2  # has dups
+                and df[url_col].eq(url).any()  # url still here
+                and df[url_col].isin(dup_urls).sum() >= 2  # dups are still here
+        ):
+            dups_rows = df.loc[df[url_col].isin(dup_urls)]
+            # keep last
+            remove_urls = dups_rows.iloc[:-1][url_col].values
+            df = df.loc[~df[url_col].isin(remove_urls)]
+    return df
+
+
+def synthetic_labels(size, label_ratio, dup_ratio, seed=0):
+    """ :return: labels DataFrame of size urls and the DuplicatesGroups of the corpus """
+    corpus = SyntheticJobAds(seed=seed).corpus(int(size / label_ratio), dup_ratio=dup_ratio)
+    dup_groups = DuplicatesGroups(corpus['url'].values, corpus['dup_group'].values)
+    rand = np.random.RandomState(seed)
+    urls = corpus['url'].sample(size, random_state=rand).values
+    labels = pd.DataFrame({
+        'url': urls,
+        'label': rand.choice(['y', 'n', '0.5'], size=size),
+        'timestamp': pd.Timestamp('2020-01-01') + pd.to_timedelta(np.arange(size), 's'),
+    })
+    return labels, dup_groups
+
+
+def run_one(size, label_ratio, dup_ratio, seed=0):
+    labels, dup_groups = synthetic_labels(size, label_ratio, dup_ratio, seed=seed)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        labeled.LABELED_ROOT_DIR = temp_dir
+        labeler = labeled.LabeledJobs(task_name='benchmark')
+        labels.to_csv(labeler.filename, index=False)
+        labeler.load()
+        labeler.dup_groups = dup_groups
+
+        start = time.time()
+        exported = labeler.export_df()
+        export_seconds = time.time() - start
+
+        no_dedup = labeler.export_df(dedup=False)
+        start = time.time()
+        reference = loop_dedup(no_dedup, dup_groups, url_col=labeler.url_col)
+        loop_seconds = time.time() - start
+
+    pd.testing.assert_frame_equal(exported, reference)
+
+    return {
+        'size': size,
+        'exported': len(exported),
+        'loop_seconds': round(loop_seconds, 3),
+        'export_seconds': round(export_seconds, 3),
+        'speedup': round(loop_seconds / max(export_seconds, 1e-6), 1),
+    }
+
+
+def run_benchmark(sizes, label_ratio, dup_ratio, seed=0):
+    results = []
+    for size in sizes:
+        result = run_one(size, label_ratio, dup_ratio, seed)
+        logger.info(f'labels export benchmark: {result}')
+        results.append(result)
+    return pd.DataFrame(results)
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000],
+                        help='numbers of labels')
+    parser.add_argument('--label-ratio', type=float, default=0.5,
+                        help='fraction of the corpus ads that are labeled')
+    parser.add_argument('--dup-ratio', type=float, default=0.3,
+                        help='approximate fraction of planted duplicates')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default='',
+                        help='optional path of a csv file to save the results to')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = run_benchmark(sizes=args.sizes,
+                            label_ratio=args.label_ratio,
+                            dup_ratio=args.dup_ratio,
+                            seed=args.seed)
+    logger.info(f'labels export benchmark results (identical exports):\n{results}')
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
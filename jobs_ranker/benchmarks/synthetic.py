@@ -0,0 +1,194 @@
+import numpy as np
+import pandas as pd
+
+_SKILLS = [
+    'python', 'java', 'scala', 'go', 'rust', 'c++', 'javascript', 'typescript',
+    'react', 'angular', 'django', 'flask', 'spring', 'kubernetes', 'docker',
+    'terraform', 'aws', 'gcp', 'azure', 'spark', 'kafka', 'airflow', 'sql',
+    'postgres', 'mongodb', 'redis', 'elasticsearch', 'tensorflow', 'pytorch',
+    'pandas', 'linux', 'ci/cd', 'jenkins', 'graphql', 'rest apis', 'microservices',
+]
+_DOMAINS = [
+    'fintech', 'healthcare', 'e-commerce', 'logistics', 'insurance', 'banking',
+    'education', 'media', 'gaming', 'energy', 'telecommunications', 'retail',
+    'government', 'travel', 'real estate', 'agriculture', 'biotech', 'security',
+]
+_ROLES = ['software engineer', 'data engineer', 'backend developer',
+          'frontend developer', 'devops engineer', 'data scientist',
+          'machine learning engineer', 'platform engineer', 'full-stack developer']
+_SENIORITY = ['junior', 'mid-level', 'senior', 'lead', 'principal', 'graduate']
+_CITIES = ['sydney', 'melbourne', 'brisbane', 'perth', 'adelaide', 'canberra']
+_COMPANY_WORDS = ['blue', 'river', 'quantum', 'peak', 'nova', 'summit', 'harbour',
+                  'atlas', 'orbit', 'cedar', 'ember', 'falcon', 'granite', 'lumen']
+_AGENCIES = ['talent bridge', 'hire partners', 'tech recruiters co',
+             'people first staffing', 'apex talent', 'nexus recruitment']
+
+_TEMPLATES = {
+    'intro': [
+        'we are a fast growing {domain} company based in {city} looking for a {seniority} {role}',
+        'our client, a leading {domain} business in {city}, is hiring a {seniority} {role}',
+        'join {company} as a {seniority} {role} and help transform the {domain} industry',
+        '{company} is a {domain} scale-up headquartered in {city} with a team of {num} engineers',
+    ],
+    'responsibility': [
+        'design, build and maintain {skill} services that process {num} million events a day',
+        'work closely with product managers to deliver features for our {domain} platform',
+        'own the migration of legacy systems to {skill} and {skill2}',
+        'mentor {seniority} engineers and run code reviews across {num} teams',
+        'improve observability and reliability of {skill} pipelines in production',
+        'collaborate with data scientists to ship {skill} models to customers',
+        'automate infrastructure on {skill} using {skill2} and best practices',
+        'participate in an on-call rotation supporting {num} critical {domain} systems',
+    ],
+    'requirement': [
+        '{num}+ years of commercial experience with {skill}',
+        'strong knowledge of {skill} and {skill2} in a {domain} environment',
+        'experience building distributed systems with {skill}',
+        'a degree in computer science or {num} years of equivalent experience',
+        'excellent communication skills and experience working with {domain} stakeholders',
+        'hands-on experience with {skill}, {skill2} and automated testing',
+    ],
+    'benefit': [
+        'salary of ${salary}k plus super and an annual bonus',
+        'flexible working with {num} days a week from home',
+        'a learning budget of ${num}00 per year and paid conference attendance',
+        'modern offices in {city} with free lunch on fridays',
+        'employee share scheme and {num} weeks of parental leave',
+    ],
+}
+
+
+class SyntheticJobAds:
+    """
+    generator of synthetic job-ads corpora with known planted near-duplicates
+    for benchmarking deduplication (and other text processing). Each original ad
+    is composed of templated sentences with randomised slots, the duplicates are:
+        - reposts: the same ad with small edits (salary, a sentence dropped or
+            added, a few words replaced)
+        - agency rewrites: same responsibilities and requirements with a
+            different intro and benefits, some shuffled sentences, and an agency footer
+    """
+
+    def __init__(self, seed=0):
+        self.rand = np.random.RandomState(seed)
+
+    def _choice(self, options):
+        return options[self.rand.randint(len(options))]
+
+    def _fill(self, template, ad_slots):
+        slots = dict(ad_slots,
+                     skill=self._choice(_SKILLS),
+                     skill2=self._choice(_SKILLS),
+                     num=self.rand.randint(2, 60),
+                     salary=self.rand.randint(60, 250))
+        return template.format(**slots)
+
+    def _sentences(self, kind, n, ad_slots):
+        templates = _TEMPLATES[kind]
+        inds = self.rand.choice(len(templates), size=min(n, len(templates)), replace=False)
+        return [self._fill(templates[i], ad_slots) for i in inds]
+
+    def _original(self):
+        slots = dict(domain=self._choice(_DOMAINS),
+                     city=self._choice(_CITIES),
+                     seniority=self._choice(_SENIORITY),
+                     role=self._choice(_ROLES),
+                     company=' '.join(self.rand.choice(_COMPANY_WORDS, 2)).title())
+        ad = dict(
+            title=f"{slots['seniority']} {slots['role']}".title(),
+            slots=slots,
+            intro=self._sentences('intro', 1, slots),
+            responsibility=self._sentences('responsibility', self.rand.randint(3, 6), slots),
+            requirement=self._sentences('requirement', self.rand.randint(3, 5), slots),
+            benefit=self._sentences('benefit', self.rand.randint(1, 4), slots),
+            footer=[])
+        return ad
+
+    def _replace_words(self, sentences, n_words):
+        sentences = list(sentences)
+        for _ in range(n_words):
+            i = self.rand.randint(len(sentences))
+            words = sentences[i].split()
+            words[self.rand.randint(len(words))] = self._choice(_SKILLS + _DOMAINS)
+            sentences[i] = ' '.join(words)
+        return sentences
+
+    def _repost(self, ad):
+        dup = dict(ad)
+        dup['benefit'] = self._sentences('benefit', len(ad['benefit']), ad['slots'])
+        dup['responsibility'] = self._replace_words(ad['responsibility'], 2)
+        if self.rand.rand() < 0.5:
+            dup['requirement'] = ad['requirement'][:-1] + \
+                                 self._sentences('requirement', 1, ad['slots'])
+        return dup
+
+    def _agency_rewrite(self, ad):
+        dup = dict(ad)
+        agency = self._choice(_AGENCIES)
+        dup['intro'] = [f'{agency} is partnering with a {ad["slots"]["domain"]} '
+                        f'client to find a {ad["slots"]["seniority"]} {ad["slots"]["role"]}']
+        dup['responsibility'] = list(self.rand.permutation(ad['responsibility']))
+        dup['requirement'] = self._replace_words(ad['requirement'], 2)
+        dup['benefit'] = self._sentences('benefit', 1, ad['slots'])
+        dup['footer'] = [f'to apply contact {agency} quoting reference '
+                         f'{self.rand.randint(10000, 99999)}']
+        return dup
+
+    @staticmethod
+    def _description(ad):
+        parts = [*ad['intro'],
+                 'responsibilities:', *ad['responsibility'],
+                 'requirements:', *ad['requirement'],
+                 'benefits:', *ad['benefit'],
+                 *ad['footer']]
+        return '\n'.join(parts)
+
+    def corpus(self, n_ads, dup_ratio=0.2):
+        """
+        :param n_ads: total number of ads
+        :param dup_ratio: approximate fraction of ads that are duplicates
+            (reposts or agency rewrites) of another ad
+        :return: DataFrame with url, title, description, salary, date and
+            dup_group (ground truth: equal for an original and its duplicates)
+            columns, in random order
+        """
+        ads, groups = [], []
+        group = 0
+        while len(ads) < n_ads:
+            original = self._original()
+            group += 1
+            ads.append(original)
+            groups.append(group)
+            while len(ads) < n_ads and self.rand.rand() < dup_ratio:
+                ads.append(self._repost(original) if self.rand.rand() < 0.5
+                           else self._agency_rewrite(original))
+                groups.append(group)
+
+        order = self.rand.permutation(len(ads))
+        return pd.DataFrame({
+            'url': [f'https://jobs.example.com/ad/{i}' for i in range(len(ads))],
+            'title': [ads[i]['title'] for i in order],
+            'description': [self._description(ads[i]) for i in order],
+            'salary': [self._salary() for _ in order],
+            'date': [self._date() for _ in order],
+            'dup_group': np.array(groups)[order],
+        })
+
+    def _salary(self):
+        kind = self.rand.randint(5)
+        low = self.rand.randint(60, 200)
+        if kind == 0:
+            return f'${low},000 - ${low + self.rand.randint(1, 40)},000 a year'
+        elif kind == 1:
+            return f'${low * 5} - ${low * 6} a day'
+        elif kind == 2:
+            return f'${low // 2} - ${low // 2 + 20} an hour'
+        elif kind == 3:
+            return f'${low},000 a year'
+        else:
+            return np.nan
+
+    def _date(self):
+        unit = self._choice(['hour', 'day', 'month'])
+        number = self.rand.randint(1, 30)
+        return f'{number} {unit}s ago' if self.rand.rand() < 0.9 else 'just posted'
@@ -0,0 +1,108 @@
+"""
+text features benchmark on synthetic job-ads: trains the regression pipeline
+with TF-IDF (vocabulary) and hashed text features on a synthetic relevance
+target and reports training time, peak RSS, pickled model size and test scores.
+
+usage: python -m jobs_ranker.benchmarks.text_features --sizes 2000 5000
+"""
+import pickle
+import resource
+import time
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from jobs_ranker.benchmarks.synthetic import SyntheticJobAds
+from jobs_ranker.config import common
+from jobs_ranker.joblist import features
+from jobs_ranker.ml import regression
+from jobs_ranker.utils.logger import logger
+
+
+def synthetic_relevance(df, seed=0):
+    """ noisy relevance target that depends on the title, description and a numeric field """
+    rand = np.random.RandomState(seed)
+    title = df['title'].str.lower()
+    description = df['description'].str.lower()
+    return (title.str.contains('senior|lead|principal').astype(float)
+            + description.str.contains('python').astype(float)
+            - description.str.contains('on-call rotation', regex=False).astype(float)
+            - 0.01 * df['days_age'].fillna(0)
+            + rand.normal(scale=0.5, size=len(df)))
+
+
+def run_one(size, mode, n_features, max_n_estimators, seed=0):
+    """
+    trains a single configuration, meant to be run in a fresh process for
+    the peak RSS to be meaningful
+    """
+    df = features.extract_numeric_fields(SyntheticJobAds(seed=seed).corpus(size))
+    df['relevance'] = synthetic_relevance(df, seed=seed)
+
+    common.MLParams.reg_text_features = mode
+    common.MLParams.reg_hashing_n_features = n_features
+    common.MLParams.lgbm_max_n_estimators = max_n_estimators
+
+    pipe = regression.LGBRegressionPipeline(
+        text_cols=['description', 'title'], num_cols=['days_age'])
+
+    start = time.time()
+    metrics, _ = pipe.train_eval(df, y_col='relevance', target_name=mode)
+    elapsed = time.time() - start
+
+    return {
+        'size': size,
+        'mode': mode,
+        'n_features': n_features if mode == 'hashing' else None,
+        'seconds': round(elapsed, 2),
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024,
+        'model_mb': round(len(pickle.dumps(pipe)) / 2 ** 20, 1),
+        **{k: round(v, 4) for k, v in metrics.items()},
+    }
+
+
+def run_benchmark(sizes, hashing_n_features, max_n_estimators, seed=0):
+    configs = [(size, 'tfidf', None) for size in sizes]
+    configs += [(size, 'hashing', n_features)
+                for size in sizes for n_features in hashing_n_features]
+    results = []
+    for size, mode, n_features in configs:
+        # fresh process per run for peak memory measurement
+        with ProcessPoolExecutor(max_workers=1) as pool:
+            result = pool.submit(run_one, size, mode, n_features,
+                                 max_n_estimators, seed).result()
+        logger.info(f'text features benchmark: {result}')
+        results.append(result)
+    return pd.DataFrame(results)
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[2000, 5000],
+                        help='corpus sizes (number of ads)')
+    parser.add_argument('--n-features', type=int, nargs='+',
+                        default=[2 ** 14, 2 ** 16, 2 ** 18],
+                        help='numbers of hashed features per text column')
+    parser.add_argument('--max-n-estimators', type=int, default=200,
+                        help='maximum number of boosting rounds (same for all configs)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', type=str, default='',
+                        help='optional path of a csv file to save the results to')
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    results = run_benchmark(sizes=args.sizes,
+                            hashing_n_features=args.n_features,
+                            max_n_estimators=args.max_n_estimators,
+                            seed=args.seed)
+    logger.info(f'text features benchmark results:\n{results}')
+    if args.output:
+        results.to_csv(args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,6 @@
 import sys
 
+from jobs_ranker.config import common
 from jobs_ranker.joblist.ranking import RankerAPI
 from jobs_ranker.tasks.configs import TasksConfigsDao
 from jobs_ranker.utils.logger import logger
@@ -17,6 +18,7 @@ class LabelingLoop:
     def __init__(self, ranker: RankerAPI):
         self.ranker = ranker
         self.skipped = set()
+        self._labels_since_rerank = 0
 
     def _prompt(self):
         y_tok = self.ranker.labeler.pos_label
@@ -36,9 +38,26 @@ class LabelingLoop:
     def end_labeling_message(message):
         logger.info(message)
 
+    def _recalc_after_label(self, url, label):
+        if not common.MLParams.online_ranker:
+            self.ranker.rerank_jobs()
+            return
+
+        # instant re-sort with the online ranker, and periodic
+        # refresh of the main model in the background
+        self.ranker.online_update(url, label)
+        self._labels_since_rerank += 1
+        if (self._labels_since_rerank >= common.MLParams.online_heavy_rerank_every
+                and not self.ranker.busy):
+            self.ranker.rerank_jobs(background=True)
+            self._labels_since_rerank = 0
+
     def run_loop(self, recalc_everytime=False):
         for url in iter(self.ranker.next_unlabeled, None):
 
+            if url in self.skipped:  # order can change after recalc
+                continue
+
             row, _ = self.ranker.url_data(url)
 
             resp = self.label_input(row)
@@ -62,7 +81,7 @@ class LabelingLoop:
             self.ranker.labeler.add_label(url, resp)
 
             if recalc_everytime:
-                self.ranker.rerank_jobs()
+                self._recalc_after_label(url, resp)
 
         if self.ranker.next_unlabeled() is None:
             self.end_labeling_message(self._END_MESSAGE)
@@ -0,0 +1,35 @@
+from argparse import ArgumentParser
+
+from jobs_ranker.joblist.labeled import LabeledJobs, SqliteLabeledJobs
+from jobs_ranker.scraping.crawling import CrawlsSqliteDao
+from jobs_ranker.tasks.configs import TasksConfigsDao
+from jobs_ranker.utils.logger import logger
+
+
+def parse_args():
+    parser = ArgumentParser()
+    parser.add_argument("-t", "--task-name", type=str, default="",
+                        help="task name to migrate, default all tasks")
+    return parser.parse_args()
+
+
+def migrate_task(task_name):
+    """ imports the labels csv file and the crawls of the task into the sqlite database """
+    # raw labels (export_df converts them to floats)
+    labels_df = LabeledJobs(task_name=task_name)._labels_df()
+    SqliteLabeledJobs(task_name=task_name).import_df(labels_df)
+    logger.info(f'imported {len(labels_df)} labels of task "{task_name}" into sqlite')
+
+    CrawlsSqliteDao.sync(TasksConfigsDao.load_config(task_name))
+
+
+def main():
+    args = parse_args()
+    task_names = [args.task_name] if args.task_name else TasksConfigsDao.all_names()
+    for task_name in task_names:
+        migrate_task(task_name)
+    logger.info('done, set StorageParams.backend to "sqlite" in config/common.py to use it')
+
+
+if __name__ == '__main__':
+    main()
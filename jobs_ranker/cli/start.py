@@ -15,8 +15,9 @@ def parse_args():
     parser.add_argument("-s", "--scrape", action="store_true",
                         help="whether to scrape. default false")
     parser.add_argument("-r", "--recalc", action="store_true",
-                        help="whether to recalc model after every new "
-                             "label. default false")
+                        help="whether to recalc ranking after every new "
+                             "label (with the online ranker, and the main "
+                             "model in the background). default false")
     parser.add_argument("-n", "--no-dedup", action="store_true",
                         help="prevent deduplication of newest scrapes w/r to"
                              " historic scrapes. default false")
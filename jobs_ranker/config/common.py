@@ -19,10 +19,18 @@ LABELED_ROOT_DIR = os.path.join(DATA_DIR, 'labeled')
 
 TASKS_CONFIGS_DIR = os.path.join(DATA_DIR, 'tasks')
 
+DEDUP_INDEX_DIR = os.path.join(DATA_DIR, 'dedup_index')
+
+FEATURES_CACHE_DIR = os.path.join(DATA_DIR, 'features_cache')
+
+MODELS_DIR = os.path.join(DATA_DIR, 'models')
+
+SQLITE_PATH = os.path.join(DATA_DIR, 'jobs_ranker.sqlite')
+
 [os.makedirs(path, exist_ok=True) for path in
  [DATA_DIR, LOG_DIR, SCRAPY_LOG_DIR,
   CRAWLS_DIR, CRAWLS_JOB_DIR, LABELED_ROOT_DIR,
-  TASKS_CONFIGS_DIR]]
+  TASKS_CONFIGS_DIR, DEDUP_INDEX_DIR, FEATURES_CACHE_DIR, MODELS_DIR]]
 
 
 def current_timestamp():
@@ -35,27 +43,68 @@ def current_date():
 
 class MLParams:
     min_training_samples = 10
+    features_dtype = 'float32'  # of the features matrices and similarities ('float64' for full precision)
     test_ratio = 0.3
     shuffle_split = False
+    eval_n_folds = 1  # k-fold evaluation (mean scores) if more than 1, instead of a single split
+    eval_n_jobs = os.cpu_count() or 1  # worker processes for fitting the folds
+
+    features_cache = True  # persist per row features between runs
+    persist_models = True  # reuse saved models if trained on the same data
+    salary_retrain_ratio = 0.1  # retrain salary model when this much of its data changed
 
     rf_n_estimators = 100
 
+    reg_text_features = 'tfidf'  # or 'hashing' for bounded memory (no vocabulary)
     reg_tfidf_ngram_range = (1, 3)
-    reg_tfidf_min_df = 3
+    reg_tfidf_min_df = 3  # (not applicable to hashing)
+    reg_hashing_n_features = 2 ** 16  # per text column
 
     lgbm_max_n_estimators = 1000
     lgbm_learning_rate = 0.005
 
+    # worker processes for evaluating the subsets (forked, so more than 1 only when
+    # not selecting from the webapp's threads)
+    column_selection_n_jobs = 1
+
+    # label model: continue boosting on new labels instead of full refits
+    lgbm_warm_start = True
+    lgbm_warm_start_n_estimators = 100
+    warm_start_max_labels_growth = 0.2  # full refit when labels grew by this ratio
+    warm_start_max_vocab_drift = 0.1  # full refit when new labels' OOV terms ratio grows by this
+    warm_start_max_rounds = 5  # full refit after this many warm starts in a row
+
+    # online (per label) ranker for labeling with recalc after every label
+    online_ranker = True
+    online_heavy_rerank_every = 10  # labels between background reranks with the main model
+    online_hash_bits = 18
+    online_ngram_range = (1, 2)
+    online_sgd_alpha = 1e-4
+    online_n_epochs = 5
+
+    dedup_method = 'tfidf_cosine'  # or 'minhash_lsh'
     dedup_tfidf_ngram_range = (3, 3)
     dedup_tfidf_max_df_cutoff = 50
     dedup_tfidf_max_df_ratio = 0.02
     dedup_simil_thershold = 0.5
+    dedup_chunk_size = 2000  # rows per block of sparse similarity products
+    dedup_n_jobs = 1  # worker processes for the similarity products
+    dedup_minhash_n_perm = 128
+    dedup_lsh_n_bands = 64
+    dedup_incremental = True  # persist a per-task index and only match new documents
+    dedup_index_refit_ratio = 0.5  # refit the index vectorizer after this growth
 
 
 class InfoParams:
     top_n_feat = 20
 
 
+class StorageParams:
+    # 'csv' files or 'sqlite' (SQLITE_PATH, import the csv files with cli/migrate_sqlite.py)
+    # for the labels, crawls and duplicates groups
+    backend = 'csv'
+
+
 HEADERS = {
     'authority': 'www.google.com',
     'scheme': 'https',
@@ -0,0 +1,231 @@
+import functools
+import hashlib
+import itertools
+import json
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from jobs_ranker.utils.instrumentation import LogCallsTimeAndOutput
+from jobs_ranker.utils.logger import logger
+
+# exactly two / one numbers in the whole string
+_TWO_NUMBERS_REGEX = re.compile(r'^[^0-9]*([0-9]+)[^0-9]+([0-9]+)[^0-9]*$')
+_ONE_NUMBER_REGEX = re.compile(r'^[^0-9]*([0-9]+)[^0-9]*$')
+# inspect regexp r'(?P<years>.{1,10}[\d+.{1,3}]?\d+\syears.{1,10})'
+_YEARS_REGEX = re.compile(r'(?P<years>\d+)\s*years')
+_MAX_YEARS_EXPERIENCE = 12
+
+
+def _contains(strings, word):
+    return strings.str.contains(word, regex=False).astype(int)
+
+
+def normalized_descriptions(descriptions):
+    """ lower-cased and flattened descriptions """
+    return (descriptions.astype(str).str.lower()
+            .str.replace('\n', ' ', regex=False)
+            .str.replace('\t', ' ', regex=False))
+
+
+def extract_numeric_fields(df):
+    """
+    vectorized extraction of numeric fields from the scraped text fields:
+        normalises (lower-cases and flattens) the description, and adds
+        description_length, salary_low, salary_high, days_age, years_exp_max columns
+    :return: new DataFrame with the normalised and added columns
+    """
+    description = normalized_descriptions(df['description'])
+
+    # salary
+    sal_str = df['salary'].astype(str)
+    sal_nums = (sal_str.str.replace(',', '', regex=False)
+                .str.extract(_TWO_NUMBERS_REGEX).astype(float))
+    sal_mult = (_contains(sal_str, 'year') * 1
+                + _contains(sal_str, 'day') * 200
+                + _contains(sal_str, 'hour') * 1600)
+
+    # date
+    date_str = df['date'].astype(str)
+    date_num = date_str.str.extract(_ONE_NUMBER_REGEX)[0].astype(float)
+    date_mult = (_contains(date_str, 'day') * 1
+                 + _contains(date_str, 'month') * 30
+                 + _contains(date_str, 'hour') * 0.04)
+
+    return df.assign(description=description,
+                     description_length=description.str.len(),
+                     salary_low=sal_nums[0] * sal_mult,
+                     salary_high=sal_nums[1] * sal_mult,
+                     days_age=np.trunc(date_num * date_mult),
+                     years_exp_max=years_experience(description).values)
+
+
+def years_experience(descriptions):
+    """
+    minimal number of years mentioned in each description ("5+ years of.."),
+        or 0 if none or if it's an unreasonable number (probably not experience)
+    :param descriptions: normalised (lower-cased) descriptions Series
+    :return: Series of int with the same index
+    """
+    matches = (descriptions.reset_index(drop=True)
+               .str.extractall(_YEARS_REGEX)['years'].astype(np.int64))
+    years = (matches.groupby(level=0).min()
+             .reindex(np.arange(len(descriptions)), fill_value=0).values)
+    years[years >= _MAX_YEARS_EXPERIENCE] = 0
+    return pd.Series(years, index=descriptions.index)
+
+
+class KeywordsMatcher:
+    """
+    matches several named groups of keywords (regexes) in texts, producing for each
+    group the unique hits ('<group>_hits') and the number of matches ('<group>_count')
+    from a single scan per group (both are derived from the same findall).
+    the groups' regexes are compiled once, without capturing groups, which keeps
+    the regex engine's literal prefix optimisations that are lost for a combined
+    named-groups alternation (that is also not equivalent when groups overlap).
+    """
+
+    def __init__(self, groups):
+        """ :param groups: dict of group name -> list of keywords """
+        self.groups = {name: list(keywords) for name, keywords in groups.items()}
+        self._regexes = {name: re.compile('|'.join(keywords))
+                         for name, keywords in self.groups.items() if keywords}
+
+    def _text_hits(self, text):
+        hits = dict.fromkeys(self.groups, [])
+        for name, regex in self._regexes.items():
+            if regex.groups:  # keywords with their own capturing groups
+                hits[name] = [match.group() for match in regex.finditer(text)]
+            else:
+                hits[name] = regex.findall(text)
+        return hits
+
+    def _match_batch(self, texts):
+        hits_cols = {name: np.empty(len(texts), dtype=object) for name in self.groups}
+        count_cols = {name: np.zeros(len(texts), dtype=int) for name in self.groups}
+        for i, text in enumerate(texts):
+            for name, hits in self._text_hits(text).items():
+                hits_cols[name][i] = np.array(sorted(set(hits)))
+                count_cols[name][i] = len(hits)
+        columns = {}
+        for name in self.groups:
+            columns[f'{name}_hits'] = hits_cols[name]
+            columns[f'{name}_count'] = count_cols[name]
+        return pd.DataFrame(columns)
+
+    def match_batches(self, texts, batch_size=10000):
+        """
+        :param texts: iterable of strings (can be a generator)
+        :return: generator of matches DataFrames (see match) for consecutive batches
+        """
+        texts = iter(texts)
+        batch = list(itertools.islice(texts, batch_size))
+        while batch:
+            yield self._match_batch(batch)
+            batch = list(itertools.islice(texts, batch_size))
+
+    def match(self, texts, batch_size=10000):
+        """
+        :param texts: iterable of strings
+        :return: DataFrame with '<group>_hits' (arrays of unique matches) and
+            '<group>_count' columns for each group
+        """
+        batches = list(self.match_batches(texts, batch_size=batch_size))
+        if not batches:
+            return self._match_batch([])
+        return pd.concat(batches, ignore_index=True)
+
+
+def keywords_matcher(groups):
+    """ :return: a cached KeywordsMatcher for these keywords groups """
+    return _cached_keywords_matcher(
+        tuple((name, tuple(keywords)) for name, keywords in groups.items()))
+
+
+@functools.lru_cache(maxsize=16)
+def _cached_keywords_matcher(groups_items):
+    return KeywordsMatcher(dict(groups_items))
+
+
+def keywords_hash(groups):
+    """ :return: hash of keywords groups (dict of group name -> list of keywords) """
+    return hashlib.md5(json.dumps(groups, sort_keys=True).encode()).hexdigest()
+
+
+def content_keys(df, cols):
+    """
+    :return: array of keys of the rows: url (column or index) and a hash
+        of the values in cols
+    """
+    urls = df['url'] if 'url' in df.columns else df.index.to_series()
+    hashes = pd.util.hash_pandas_object(df[cols].astype(str), index=False)
+    return urls.astype(str).values + '#' + hashes.map('{:016x}'.format).values
+
+
+class FeaturesCache(LogCallsTimeAndOutput):
+    """
+    persistent cache of per row features, keyed by content keys of the rows
+    (see content_keys), and a version (e.g. a hash of the keywords that the
+    features depend on). Only the rows that are not in the cache (for the
+    current version) are computed, and entries of other versions are dropped.
+    """
+    _version_col = '_version'
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._df = None
+
+    def _load(self):
+        if self._df is None:
+            if os.path.exists(self.path):
+                try:
+                    self._df = pd.read_pickle(self.path)
+                except Exception as e:
+                    logger.error(f'failed loading features cache {self.path} ({repr(e)})')
+            if self._df is None:
+                self._df = pd.DataFrame({self._version_col: []})
+        return self._df
+
+    def save(self):
+        temp_path = self.path + '.tmp'
+        self._df.to_pickle(temp_path)
+        os.replace(temp_path, self.path)
+
+    def features(self, df, keys, compute, version=''):
+        """
+        :param df: DataFrame of rows to get features for
+        :param keys: unique content keys of the rows of df
+        :param compute: function from a DataFrame (subset of rows of df)
+            to a DataFrame of the features for those rows (same index)
+        :param version: features version, cached rows with other versions are ignored
+        :return: DataFrame of features for df rows (same index as df)
+        """
+        cache = self._load()
+        cache = cache.loc[cache[self._version_col] == version]
+        cached_rows = cache.index.get_indexer(keys)
+        hit = cached_rows >= 0
+
+        parts = []
+        if hit.any():
+            hits_df = cache.iloc[cached_rows[hit]].drop(columns=self._version_col)
+            hits_df.index = np.flatnonzero(hit)
+            parts.append(hits_df)
+        if (~hit).any():
+            computed = compute(df.loc[~hit])
+            new_entries = computed.assign(**{self._version_col: version})
+            new_entries.index = keys[~hit]
+            cache = pd.concat([cache, new_entries], sort=False)
+            self._df = cache.loc[~cache.index.duplicated(keep='last')]
+            self.save()
+            computed.index = np.flatnonzero(~hit)
+            parts.append(computed)
+
+        logger.info(f'features cache {os.path.basename(self.path)}: '
+                    f'{hit.sum()} hits, {(~hit).sum()} misses')
+
+        result = pd.concat(parts, sort=False).sort_index() if parts else pd.DataFrame()
+        result.index = df.index
+        return result
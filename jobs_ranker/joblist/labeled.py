@@ -1,10 +1,14 @@
 import abc
+import csv
 import os
+import threading
 
 import pandas as pd
 
+from jobs_ranker.config import common
 from jobs_ranker.config.common import LABELED_ROOT_DIR
 from jobs_ranker.utils.instrumentation import LogCallsTimeAndOutput
+from jobs_ranker.utils import sqlite_db
 from jobs_ranker.utils.logger import logger
 
 
@@ -31,51 +35,200 @@ class LabelsAPI(abc.ABC):
     def export_html_table(self):
         return ''
 
+    @abc.abstractmethod
+    def labels_page(self, offset=0, limit=None, sort_col=None, ascending=True, url_filter=''):
+        return pd.DataFrame(), 0
+
 
 class LabeledJobs(LabelsAPI, LogCallsTimeAndOutput):
+    """
+    labels are appended to the labels csv file as a journal (the last label of a url
+        overrides the previous ones), which is compacted once it has
+        compaction_ratio more rows than labeled urls
+    """
+    compaction_ratio = 0.5
+    compaction_min_rows = 100
 
-    def __init__(self, task_name, dup_dict=None):
+    def __init__(self, task_name, dup_groups=None):
+        """
+        :param dup_groups: DuplicatesGroups for treating duplicates of
+            labeled urls as labeled
+        """
         super().__init__()
         self.filename = self._task_name_to_filename(task_name)
-        self.dup_dict = dup_dict if dup_dict is not None else {}
+        self._dup_groups = dup_groups
         self._df = None
+        self._new_rows = []  # labels added since load (not in _df yet)
+        self._journal_rows = 0
+        self._loaded_stat = None
+        # index for is_labeled: labeled urls and the duplicates groups of labeled urls
+        self._labeled_urls = set()
+        self._labeled_groups = set()
+        # sorted exports for labels_page by (sort_col, ascending), of the labels file stat
+        self._sorted_exports = {}
+        self._sorted_exports_stat = None
         self.load()
 
+    @property
+    def dup_groups(self):
+        return self._dup_groups
+
+    @dup_groups.setter
+    def dup_groups(self, dup_groups):
+        self._dup_groups = dup_groups
+        self._sorted_exports = {}
+        self._build_index()
+
     @staticmethod
     def _task_name_to_filename(task_name):
         return os.path.join(LABELED_ROOT_DIR, f'{task_name}.csv')
 
+    @LogCallsTimeAndOutput.do_not_decorate
+    def _file_stat(self):
+        try:
+            stat = os.stat(self.filename)
+            return stat.st_mtime_ns, stat.st_size
+        except FileNotFoundError:
+            return None
+
     def save(self):
-        self._df.to_csv(self.filename, index=None)
+        """
+        compacts the labels file: rewrites it with only the last label of each url
+            (atomically, so a crash leaves either the old or the new file)
+        """
+        df = self._labels_df()
+        temp_path = self.filename + '.tmp'
+        with open(temp_path, 'wt') as f:
+            df.to_csv(f, index=None)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.filename)
+        self._journal_rows = len(df)
+        self._loaded_stat = self._file_stat()
+
+    def _recover_truncated_line(self):
+        # a crash while appending can leave a partial last line, which is removed
+        with open(self.filename, 'rb+') as f:
+            content = f.read()
+            if content and not content.endswith(b'\n'):
+                end = content.rfind(b'\n') + 1
+                logger.warning(f'removing truncated last line from '
+                               f'{self.filename}: {content[end:]}')
+                f.truncate(end)
+                f.flush()
+                os.fsync(f.fileno())
 
     def load(self):
         if os.path.exists(self.filename):
-            self._df = pd.read_csv(self.filename). \
+            self._recover_truncated_line()
+            try:
+                df = pd.read_csv(self.filename, dtype={self.label_col: str})
+            except pd.errors.EmptyDataError:
+                df = self._empty_df()
+            self._journal_rows = len(df)
+            self._df = df.dropna(subset=[self.url_col, self.label_col]). \
                 drop_duplicates(subset=[self.url_col], keep='last')
         else:
-            self._df = pd.DataFrame({self.url_col: [], self.label_col: [], self.timestamp_col: []})
+            self._journal_rows = 0
+            self._df = self._empty_df()
+        self._new_rows = []
+        self._loaded_stat = self._file_stat()
+        self._build_index()
+
+    def _empty_df(self):
+        return pd.DataFrame({self.url_col: [], self.label_col: [], self.timestamp_col: []})
+
+    @LogCallsTimeAndOutput.do_not_decorate
+    def _reload_if_changed(self):
+        # the file was changed not by this object (e.g. by another process)
+        if self._file_stat() != self._loaded_stat:
+            logger.info(f'labels file {self.filename} changed, reloading')
+            self.load()
+
+    def _labels_df(self):
+        """ :return: last label of each url (including labels added since load) """
+        if self._new_rows:
+            self._df = pd.concat([self._df, pd.DataFrame(self._new_rows)], sort=False). \
+                drop_duplicates(subset=[self.url_col], keep='last')
+            self._new_rows = []
+        return self._df
 
-    def _urls_with_dups(self, url):
-        return self.dup_dict.get(url, [url])
+    def _append_to_journal(self, row):
+        """ appends a row to the labels file and syncs it to disk """
+        stat = self._file_stat()
+        new_file = stat is None or stat[1] == 0  # missing or empty (no header)
+        with open(self.filename, 'at', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(row), lineterminator='\n')
+            if new_file:
+                writer.writeheader()
+            writer.writerow(row)
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_rows += 1
+        self._loaded_stat = self._file_stat()
 
+    def _groups_of(self, urls):
+        """ :return: set of the known duplicates groups of the urls """
+        if self.dup_groups is None:
+            return set()
+        groups = self.dup_groups.groups_of(urls)
+        return set(groups[groups >= 0].tolist())
+
+    def _build_index(self):
+        urls = self._df[self.url_col].values
+        self._labeled_urls = set(urls)
+        self._labeled_groups = self._groups_of(urls)
+
+    def _add_to_index(self, url):
+        self._labeled_urls.add(url)
+        self._labeled_groups.update(self._groups_of([url]))
+
+    def _keep_last_of_groups(self, df):
+        """ :return: df with only the last label of each duplicates group """
+        urls = df[self.url_col].astype(str).reset_index(drop=True)
+        groups = pd.Series(self.dup_groups.groups_of(urls.values))
+        # urls without a group are their own group
+        keys = groups.astype(str).where(groups >= 0, 'url:' + urls)
+        return df.loc[~keys.duplicated(keep='last').values]
+
+    @LogCallsTimeAndOutput.do_not_decorate
     def is_labeled(self, url):
-        return self._df[self.url_col].isin(self._urls_with_dups(url)).any()
+        """ whether the url or any of its duplicates is labeled """
+        self._reload_if_changed()
+        if url in self._labeled_urls:
+            return True
+        if self.dup_groups is None:
+            return False
+        return self.dup_groups.group_of(url) in self._labeled_groups
 
     def add_label(self, url, label):
+        """
+        appends the label to the labels file (without rewriting it) and to the labels
+            in memory, the file is compacted when it has too many overridden labels
+        """
         if self.is_valid_label(label):
-            self.load()
-            self._df = self._df.append(
-                pd.DataFrame({self.url_col: [url],
-                              self.label_col: [label],
-                              self.timestamp_col: [str(pd.datetime.now())]}))
-            self.save()
+            self._reload_if_changed()
+            # same columns order as in the file
+            row = {col: None for col in self._df.columns}
+            row.update({self.url_col: url,
+                        self.label_col: label,
+                        self.timestamp_col: str(pd.Timestamp.now())})
+            self._append_to_journal(row)
+            self._new_rows.append(row)
+            self._add_to_index(url)
+            if (self._journal_rows > self.compaction_min_rows and
+                    self._journal_rows > len(self._labeled_urls) * (1 + self.compaction_ratio)):
+                self.save()
             logger.info(f'Added label: {label} for {url}')
 
+    def label_value(self, label: str):
+        return float(label.
+                     replace(self.pos_label, '1.0').
+                     replace(self.neg_label, '0.0'))
+
     def is_valid_label(self, label: str):
         try:
-            number = float(label.
-                           replace(self.pos_label, '1.0').
-                           replace(self.neg_label, '0.0'))
+            number = self.label_value(label)
             if not 0 <= number <= 1:
                 raise ValueError
             return True
@@ -85,6 +238,7 @@ class LabeledJobs(LabelsAPI, LogCallsTimeAndOutput):
             return False
 
     def __repr__(self):
+        self._labels_df()
         total = len(self._df)
         neg = (self._df.loc[:, self.label_col] == self.neg_label).sum()
         pos = (self._df.loc[:, self.label_col] == self.pos_label).sum()
@@ -93,26 +247,17 @@ class LabeledJobs(LabelsAPI, LogCallsTimeAndOutput):
                 f'{(total - pos - neg) / total:.1%} partial relevance)')
 
     def export_df(self, dedup=True):
+        self._reload_if_changed()
 
-        df = self._df.copy()
+        df = self._labels_df().copy()
 
         df[self.label_col] = df[self.label_col]. \
             replace(self.pos_label, '1.0'). \
             replace(self.neg_label, '0.0'). \
             astype(float)
 
-        if dedup:
-            all_urls = df[self.url_col].values
-            for url in all_urls:
-                dup_urls = self.dup_dict.get(url, [])
-                if (len(dup_urls) >= 2  # has dups
-                    and df[self.url_col].eq(url).any()  # url still here
-                    and df[self.url_col].isin(dup_urls).sum() >= 2  # dups are still here
-                ):
-                    dups_rows = df.loc[df[self.url_col].isin(dup_urls)]
-                    # keep last
-                    remove_urls = dups_rows.iloc[:-1][self.url_col].values
-                    df = df.loc[~df[self.url_col].isin(remove_urls)]
+        if dedup and self.dup_groups is not None:
+            df = self._keep_last_of_groups(df)
         return df
 
     def export_html_table(self):
@@ -126,8 +271,171 @@ class LabeledJobs(LabelsAPI, LogCallsTimeAndOutput):
                 .background_gradient(cmap='Purples', subset=['label'])
                 .render())
 
+    def _check_sort_col(self, sort_col):
+        if sort_col not in [None, self.url_col, self.label_col, self.timestamp_col]:
+            raise ValueError(f'can\'t sort labels by "{sort_col}"')
+
+    def labels_page(self, offset=0, limit=None, sort_col=None, ascending=True, url_filter=''):
+        """
+        :param sort_col: url, label or timestamp column, None for labeling order
+        :param url_filter: substring of the urls (case insensitive)
+        :return: page of the exported labels, and the number of the filtered labels
+        """
+        self._check_sort_col(sort_col)
+        df = self._sorted_export(sort_col, ascending)
+        if url_filter:
+            df = df[df[self.url_col].str.contains(url_filter, case=False, regex=False)]
+        end = None if limit is None else offset + limit
+        return df.iloc[offset:end], len(df)
+
+    def _sorted_export(self, sort_col, ascending):
+        """ :return: sorted export_df, cached until the labels file changes """
+        self._reload_if_changed()
+        if self._sorted_exports_stat != self._loaded_stat:
+            self._sorted_exports = {}
+            self._sorted_exports_stat = self._loaded_stat
+        key = sort_col, ascending
+        if key not in self._sorted_exports:
+            df = self.export_df()
+            if sort_col is not None:
+                df = df.sort_values(sort_col, ascending=ascending, kind='mergesort')
+            elif not ascending:
+                df = df.iloc[::-1]
+            self._sorted_exports[key] = df
+        return self._sorted_exports[key]
+
+
+class SqliteLabeledJobs(LabeledJobs):
+    """
+    labels and the task's duplicates groups in the sqlite database (see utils.sqlite_db),
+        is_labeled and the labels are indexed queries, so there's nothing to load
+        and changes by other processes are seen immediately
+    """
+
+    def __init__(self, task_name, dup_groups=None, db_path=None):
+        self.task_name = task_name
+        self.db_path = db_path
+        super().__init__(task_name=task_name)
+        self.dup_groups = dup_groups
+
+    def _conn(self):
+        return sqlite_db.connection(self.db_path)
+
+    @LabeledJobs.dup_groups.setter
+    def dup_groups(self, dup_groups):
+        self._dup_groups = dup_groups
+        if dup_groups is not None:
+            self._save_dup_groups()
+
+    def _save_dup_groups(self):
+        """ upserts only the changed urls' groups (and deletes the removed urls) """
+        # urls can repeat, the last group is used (same as in DuplicatesGroups)
+        groups = pd.Series(self.dup_groups.group_ids, index=self.dup_groups.urls)
+        groups = groups[~groups.index.duplicated(keep='last')]
+        saved = pd.read_sql_query(
+            'SELECT url, group_id FROM dup_groups WHERE task = ?',
+            self._conn(), params=(self.task_name,), index_col='url')['group_id']
+        removed = saved.index.difference(groups.index)
+        changed = groups[saved.reindex(groups.index).ne(groups).values]
+        with self._conn() as conn:
+            conn.executemany(
+                'DELETE FROM dup_groups WHERE task = ? AND url = ?',
+                ((self.task_name, url) for url in removed.tolist()))
+            conn.executemany(
+                'INSERT OR REPLACE INTO dup_groups (task, url, group_id) VALUES (?, ?, ?)',
+                ((self.task_name, url, group) for url, group in
+                 zip(changed.index.tolist(), changed.values.tolist())))
+        logger.info(f'dup groups: {len(changed)} urls upserted, {len(removed)} deleted')
+
+    def save(self):
+        """ labels are saved when added """
+
+    def load(self):
+        self._labels_df()
+
+    @LogCallsTimeAndOutput.do_not_decorate
+    def _reload_if_changed(self):
+        pass
+
+    def _labels_df(self):
+        self._df = pd.read_sql_query(
+            'SELECT url, label, timestamp FROM labels WHERE task = ? ORDER BY id',
+            self._conn(), params=(self.task_name,))
+        return self._df
+
+    def import_df(self, df):
+        """ adds labels (e.g. from the csv file) keeping their order and timestamps """
+        with self._conn() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO labels (task, url, label, timestamp) '
+                'VALUES (?, ?, ?, ?)',
+                ((self.task_name, row[self.url_col], str(row[self.label_col]),
+                  row[self.timestamp_col])
+                 for row in df.to_dict('records')))
+
+    def labels_page(self, offset=0, limit=None, sort_col=None, ascending=True, url_filter=''):
+        self._check_sort_col(sort_col)
+        where = 'task = :task'
+        if url_filter:
+            where += ' AND instr(lower(url), lower(:url_filter)) > 0'
+        # same float labels as export_df
+        label_value = ('CASE label WHEN :pos THEN 1.0 WHEN :neg THEN 0.0 '
+                       'ELSE CAST(label AS REAL) END')
+        order = {self.url_col: 'url', self.label_col: label_value,
+                 self.timestamp_col: 'timestamp'}.get(sort_col, 'id')
+        params = dict(task=self.task_name, url_filter=url_filter,
+                      pos=self.pos_label, neg=self.neg_label,
+                      limit=-1 if limit is None else limit, offset=offset)
+        total = self._conn().execute(
+            f'SELECT COUNT(*) FROM labels WHERE {where}', params).fetchone()[0]
+        df = pd.read_sql_query(
+            f'SELECT url, {label_value} AS label, timestamp FROM labels WHERE {where} '
+            f'ORDER BY {order} {"ASC" if ascending else "DESC"}, id '
+            f'LIMIT :limit OFFSET :offset',
+            self._conn(), params=params)
+        return df, total
+
+    @LogCallsTimeAndOutput.do_not_decorate
+    def is_labeled(self, url):
+        """ whether the url or any of its duplicates is labeled """
+        return bool(self._conn().execute(
+            'SELECT EXISTS ('
+            'SELECT 1 FROM labels WHERE task = :task AND url = :url '
+            'UNION ALL '
+            'SELECT 1 FROM dup_groups g '
+            'JOIN dup_groups d ON d.task = g.task AND d.group_id = g.group_id '
+            'JOIN labels l ON l.task = d.task AND l.url = d.url '
+            'WHERE g.task = :task AND g.url = :url)',
+            dict(task=self.task_name, url=url)).fetchone()[0])
+
+    def add_label(self, url, label):
+        if self.is_valid_label(label):
+            with self._conn() as conn:
+                conn.execute(
+                    'INSERT OR REPLACE INTO labels (task, url, label, timestamp) '
+                    'VALUES (?, ?, ?, ?)',
+                    (self.task_name, url, label, str(pd.Timestamp.now())))
+            logger.info(f'Added label: {label} for {url}')
+
+
+def get_labeler(task_name, dup_groups=None) -> LabeledJobs:
+    """ :return: labels DAO of the configured storage backend (StorageParams.backend) """
+    if common.StorageParams.backend == 'sqlite':
+        return SqliteLabeledJobs(task_name=task_name, dup_groups=dup_groups)
+    return LabeledJobs(task_name=task_name, dup_groups=dup_groups)
+
+
+# labelers of the history pages by backend and task, the labels are only
+# reloaded if the labels file was changed. the labelers aren't thread safe
+# and the webapp's requests are handled in threads, so they're used under the lock
+_history_labelers = {}
+_history_labelers_lock = threading.Lock()
+
 
-def labels_history_table(task_name):
-    labeler = LabeledJobs(task_name=task_name)
-    labeler.load()
-    return labeler.export_html_table()
\ No newline at end of file
+def labels_history_page(task_name, **page_kwargs):
+    """ :return: page of the labels history and the number of labels (see labels_page) """
+    key = common.StorageParams.backend, task_name
+    with _history_labelers_lock:
+        if key not in _history_labelers:
+            _history_labelers[key] = get_labeler(task_name=task_name)
+        return _history_labelers[key].labels_page(**page_kwargs)
\ No newline at end of file
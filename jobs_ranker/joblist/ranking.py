@@ -1,18 +1,20 @@
 import abc
-import re
 import time
 from concurrent.futures import ThreadPoolExecutor
-from itertools import product
 from threading import Lock
 
 import numpy as np
 import pandas as pd
 
 from jobs_ranker.config import common
-from jobs_ranker.joblist.labeled import LabeledJobs, LabelsAPI
-from jobs_ranker.ml import regression
-from jobs_ranker.ml.deduplication import calc_duplicates
-from jobs_ranker.scraping.crawling import CrawlsFilesDao
+from jobs_ranker.joblist import features
+from jobs_ranker.joblist.labeled import LabelsAPI, get_labeler
+from jobs_ranker.joblist.stages import Stage, StagesGraph
+from jobs_ranker.ml import models_store, regression
+from jobs_ranker.ml.deduplication import calc_duplicates, DedupIndex, DuplicatesGroups
+from jobs_ranker.ml.models_store import ModelsStore
+from jobs_ranker.ml.online import OnlineRanker
+from jobs_ranker.scraping.crawling import crawls_dao
 from jobs_ranker.tasks.configs import TaskConfig, TasksConfigsDao
 from jobs_ranker.utils.instrumentation import LogCallsTimeAndOutput
 from jobs_ranker.utils.logger import logger
@@ -52,7 +54,7 @@ class RankerAPI(abc.ABC):
 
     @abc.abstractmethod
     def url_data(self, url):
-        return pd.Series()
+        return pd.Series(dtype=float)
 
     @abc.abstractmethod
     def next_unlabeled(self):
@@ -62,6 +64,14 @@ class RankerAPI(abc.ABC):
     def rerank_jobs(self, background=False):
         pass
 
+    @abc.abstractmethod
+    def online_update(self, url, label):
+        return False
+
+    @abc.abstractmethod
+    def select_label_columns(self, background=False):
+        pass
+
     @property
     @abc.abstractmethod
     def ranking_scores(self):
@@ -77,6 +87,7 @@ def get_ranker(task_config: TaskConfig,
 class JobsRanker(RankerAPI, LogCallsTimeAndOutput):
     keyword_score_col = 'keyword_score'
     model_score_col = 'model_score'
+    online_score_col = 'online_score'
     salary_guess_col = 'salary_guess'
     years_experience_col = 'years_exp_max'
     scrape_order_rank_col = 'scrape_order_rank'
@@ -84,6 +95,15 @@ class JobsRanker(RankerAPI, LogCallsTimeAndOutput):
     description_col = 'description'
     title_col = 'title'
     text_cols = [description_col, title_col]
+    # attributes that are saved and restored with each kind of model
+    models_attrs = {'salary': ['regressor_salary', 'reg_sal_model_score',
+                               'salary_train_keys'],
+                    'label': ['regressor', 'model_score',
+                              'keyword_score', 'scrape_order_score', 'scores_std',
+                              'label_full_fit', 'online_ranker', 'online_score']}
+    # label model attributes that are restored for continuing its training (warm start)
+    warm_start_attrs = ['regressor', 'model_score', 'keyword_score',
+                        'scrape_order_score', 'scores_std', 'label_full_fit']
 
     def __init__(self,
                  task_config: TaskConfig,
@@ -92,22 +112,40 @@ class JobsRanker(RankerAPI, LogCallsTimeAndOutput):
                          dedup_recent=dedup_recent)
         self.regressor = None
         self.model_score = None
+        self.online_ranker = None
+        self.online_score = None
+        self._online_texts = None
         self.keyword_score = None
         self.scrape_order_score = None
+        self.scores_std = {}  # of the k-fold evaluation scores (if evaluated with k-fold)
         self.regressor_salary = None
         self.reg_sal_model_score = None
+        self.salary_train_keys = None
+        self.label_full_fit = None
         self.df_recent = None
         self.df_all_deduped = None
         self.df_all_read = None
         self.intermidiate_score_cols = []
         self._labels_dao = None
 
-        self.dup_dict = {}
+        self.dup_groups = None
+        self._dedup_index = None
+        self._features_caches = {}
+        self._crawl_files = []
+        self._loaded_crawls = None
+        self._stages = self._stages_graph()
+        self._models_fingerprints = {}
+        self._data_version = 0
+        self._salary_checked_for = None
+        self._salary_guesses = pd.Series(dtype=float)
+        self._salary_guesses_model = None
         self._unlabeled = None
 
         self._bg_executor = ThreadPoolExecutor(max_workers=1)
         self._busy_lock = Lock()
         self._bg_future = None
+        self._selection_executor = ThreadPoolExecutor(max_workers=1)
+        self._selection_future = None
 
     @property
     def num_cols_salary(self):
@@ -123,6 +161,23 @@ class JobsRanker(RankerAPI, LogCallsTimeAndOutput):
                  self.years_experience_col,
                  self.scrape_order_rank_col])
 
+    @property
+    def label_regressor_cols(self):
+        """
+        :return: text and numeric columns of the label regressor: the saved
+            columns selection, keeping the columns that weren't evaluated by it
+        """
+        text_cols, num_cols = self.text_cols, self.num_cols_label
+        selection = self.task_config.label_columns
+        if selection:
+            def keep(col):
+                return col in selection['selected'] or col not in selection['evaluated']
+
+            if any(keep(col) for col in text_cols + num_cols):
+                text_cols = [col for col in text_cols if keep(col)]
+                num_cols = [col for col in num_cols if keep(col)]
+        return text_cols, num_cols
+
     @property
     def loaded(self):
         self._check_bg_thread()
@@ -139,10 +194,10 @@ class JobsRanker(RankerAPI, LogCallsTimeAndOutput):
     @property
     def labeler(self):
         if self._labels_dao is None:
-            if not self.dup_dict:
-                raise ValueError(f'dup_dict is not set')
-            self._labels_dao = LabeledJobs(task_name=self.task_config.name,
-                                           dup_dict=self.dup_dict)
+            if self.dup_groups is None:
+                raise ValueError(f'dup_groups is not set')
+            self._labels_dao = get_labeler(task_name=self.task_config.name,
+                                           dup_groups=self.dup_groups)
         return self._labels_dao
 
     def _do_in_background(self, func):
@@ -159,12 +214,46 @@ class JobsRanker(RankerAPI, LogCallsTimeAndOutput):
         else:
             self._load_and_process_data()
 
+    def _stages_graph(self):
+        """
+        loading and ranking stages: e.g. when only the labels changed only the label
+            model and the scores are recomputed, and when only the keywords changed
+            the scraped data, duplicates and numeric fields are reused
+        """
+        task_fingerprint = lambda: models_store.fingerprint(**self.task_config.data_dict())
+        keywords_fingerprint = lambda: features.keywords_hash(
+            {kind: self.task_config[kind] for kind in TaskConfig.KEYWORD_KEYS})
+        labels_fingerprint = lambda: models_store.frame_fingerprint(
+            self.labeler.export_df(dedup=False))
+        return StagesGraph(stages=[
+            Stage('scraped', self._read_all_scraped, inputs=['crawls']),
+            Stage('duplicates', self._calc_duplicates, deps=['scraped'],
+                  inputs=['ml_params']),
+            # unlabeled recent jobs, invalidated on each load
+            Stage('recent', self._set_df_recent, deps=['duplicates']),
+            Stage('numeric', self._extract_numeric_fields, deps=['recent']),
+            Stage('keywords', self._add_keyword_features, deps=['numeric'],
+                  inputs=['keywords']),
+            Stage('salary', self._add_salary_guess, deps=['keywords'],
+                  inputs=['task', 'ml_params']),
+            Stage('label_model', lambda df: self._train_label_regressor(),
+                  deps=['salary'], inputs=['labels', 'task', 'label_columns', 'ml_params']),
+            Stage('scores', lambda df, _: self._add_model_score(df),
+                  deps=['salary', 'label_model']),
+        ], inputs=dict(crawls=lambda: self._loaded_crawls,
+                       ml_params=models_store.ml_params_fingerprint,
+                       keywords=keywords_fingerprint,
+                       task=task_fingerprint,
+                       label_columns=lambda: self.label_regressor_cols,
+                       labels=labels_fingerprint))
+
     def _load_and_process_data(self):
         with self._busy_lock:
             self.task_config = TasksConfigsDao.load_config(self.task_config.name)
-            self._read_all_scraped()
-            self._calc_duplicates()
-            self._set_df_recent()
+            self._loaded_crawls = models_store.files_fingerprint(
+                crawls_dao().get_crawls(self.task_config, raise_on_missing=True))
+            self._stages.invalidate('recent')
+            self._stages.run('recent')
         if len(self.df_recent):
             self._rank_jobs()
 
@@ -177,69 +266,79 @@ class JobsRanker(RankerAPI, LogCallsTimeAndOutput):
     def _rank_jobs(self):
         with self._busy_lock:
             self.task_config = TasksConfigsDao.load_config(self.task_config.name)
-            self.df_recent = self._add_model_score(self.df_recent)
-            self.df_recent = self._sort_jobs(self.df_recent)
+            # copy because the scores stage output is memoized and sorting is inplace
+            self.df_recent = self._sort_jobs(self._stages.run('scores').copy())
             self._unlabeled = None
+            self._online_texts = None
 
     def _read_all_scraped(self):
-        files = CrawlsFilesDao.get_crawls(
+        files = crawls_dao().get_crawls(
             self.task_config, raise_on_missing=True)
 
         df_all = pd.concat(
-            [CrawlsFilesDao.read_scrapy_file(file) for file in files],
+            [crawls_dao().read_scrapy_file(file) for file in files],
             axis=0, sort=False). \
             dropna(subset=[self.description_col])
 
+        self._crawl_files = files
+        self._data_version += 1
+
         # basic deduping by url for all-read jobs
         self.df_all_read = df_all.drop_duplicates(
             subset=['url'], keep='last')
+        return self.df_all_read
+
+    def _calc_duplicates(self, df_all):
+
+        if common.MLParams.dedup_incremental:
+            if self._dedup_index is None:
+                self._dedup_index = DedupIndex.load(self.task_config.dedup_index_path)
+            keep_inds, group_ids = calc_duplicates(
+                df_all[self.description_col], keep='last',
+                keys=features.content_keys(df_all, cols=[self.description_col]),
+                dedup_index=self._dedup_index)
+            self._dedup_index.save()
+        else:
+            keep_inds, group_ids = calc_duplicates(
+                df_all[self.description_col], keep='last')
 
-    def _calc_duplicates(self):
-
-        df_all = self.df_all_read
-
-        keep_inds, dup_dict_inds = calc_duplicates(
-            df_all[self.description_col], keep='last')
-
-        urls = df_all['url'].values
-        self.dup_dict = {urls[i]: urls[sorted([i] + list(dups))]
-                         for i, dups in dup_dict_inds.items()}
+        self.dup_groups = DuplicatesGroups(df_all['url'].values, group_ids)
+        if self._labels_dao is not None:
+            self._labels_dao.dup_groups = self.dup_groups
 
         # dedup by content and keep last
         self.df_all_deduped = df_all.iloc[keep_inds]
 
         logger.info(f'total historic jobs DF: {len(self.df_all_deduped)} '
                     f'(deduped from {len(df_all)})')
+        return self.df_all_deduped
 
-    def _set_df_recent(self):
-        self.recent_crawl_source = CrawlsFilesDao.get_crawls(
+    def _set_df_recent(self, df_all_deduped):
+        self.recent_crawl_source = crawls_dao().get_crawls(
             task_config=self.task_config)[-1]
-        recent_full_df = CrawlsFilesDao.read_scrapy_file(self.recent_crawl_source)
+        recent_full_df = crawls_dao().read_scrapy_file(self.recent_crawl_source)
         if not self.dedup_recent:
             self.df_recent = recent_full_df
             self._add_duplicates_column()
         else:
             self.df_recent = (
-                self.df_all_deduped.loc[self.df_all_deduped['scraped_file'] ==
-                                        self.recent_crawl_source, :])
+                df_all_deduped.loc[df_all_deduped['scraped_file'] ==
+                                   self.recent_crawl_source, :])
             unlabeled = [u for u in self.df_recent['url']
                          if not self.labeler.is_labeled(u)]
             self.df_recent = self.df_recent[self.df_recent['url'].isin(unlabeled)]
 
+        self._online_texts = None
+
         logger.info(f'most recent scrape DF: '
                     f'{len(self.df_recent)} ({self.recent_crawl_source}, '
                     f'all scraped: {len(recent_full_df)})')
+        return self.df_recent
 
     def _add_duplicates_column(self):
-        dup_no_self = {k: [u for u in v if u != k]
-                       for k, v in self.dup_dict.items()}
-        dups_lists = [(l if l else None) for l in list(dup_no_self.values())]
-        df_dups = pd.DataFrame({
-            'url': list(dup_no_self.keys()),
-            'duplicates': dups_lists,
-            # 'duplicates_avg_label':
-        })
-        self.df_recent = pd.merge(self.df_recent, df_dups, on='url', how='left')
+        self.df_recent = self.df_recent.assign(duplicates=[
+            list(self.dup_groups.duplicates_of(url)) or None
+            for url in self.df_recent['url']])
 
     def url_data(self, url):
         not_show_cols = (
@@ -263,15 +362,58 @@ class JobsRanker(RankerAPI, LogCallsTimeAndOutput):
             self._unlabeled = self._unlabeled_gen()
         return next(self._unlabeled, None)
 
+    def online_update(self, url, label):
+        """
+        updates the online ranker with a new label and re-sorts the recent jobs
+            by its score (skipped if the ranker is busy reranking)
+        :return: whether the online ranker was updated
+        """
+        if not self._busy_lock.acquire(blocking=False):
+            logger.info('ranker is busy, online update skipped')
+            return False
+        try:
+            row = self.df_recent.loc[self.df_recent['url'] == url]
+            if not len(row) or not all(col in row.columns for col in self.num_cols_label):
+                return False
+
+            if self.online_ranker is None:
+                self.online_ranker = OnlineRanker(
+                    text_cols=self.text_cols, num_cols=self.num_cols_label)
+            self.online_ranker.partial_fit(row, [self.labeler.label_value(label)])
+            self.online_score = self.online_ranker.score
+
+            if self._online_texts is None:
+                self._online_texts = self.online_ranker.transform_texts(self.df_recent)
+            scores = self.online_ranker.predict(self.df_recent, texts=self._online_texts)
+
+            # sort the cached texts features together with the rows (on a copy,
+            # the scores stage output is memoized)
+            order = np.argsort(-scores, kind='mergesort')
+            df = self.df_recent.iloc[order].copy()
+            df[self.online_score_col] = scores[order]
+            self.df_recent = df
+            self._online_texts = self._online_texts[order]
+            # the memoized online scores are of the ranker before the update
+            self._stages.invalidate('scores')
+            if self.online_score is not None:
+                self.sort_col = self.online_score_col
+            self._unlabeled = None
+            return True
+        finally:
+            self._busy_lock.release()
+
     def _sort_jobs(self, df):
         sort_cols = [self.scrape_order_rank_col,
                      self.keyword_score_col,
-                     self.model_score_col]
-        scores = [self.scrape_order_score,
-                  self.keyword_score,
-                  self.model_score]
-
-        if not any(scores):  # didn't train, choose default
+                     self.model_score_col,
+                     self.online_score_col]
+        # online score is None if not enough labels were seen (or online ranker is off)
+        scores = np.array([self.scrape_order_score,
+                           self.keyword_score,
+                           self.model_score,
+                           self.online_score], dtype=float)
+
+        if not np.nan_to_num(scores).any():  # didn't train, choose default
             self.sort_col = (self.keyword_score_col if self.task_config.has_keywords()
                              else self.scrape_order_rank_col)
         else:
@@ -284,41 +426,65 @@ class JobsRanker(RankerAPI, LogCallsTimeAndOutput):
     @property
     def ranking_scores(self):
         none_to_nan = lambda arg: arg if arg is not None else np.nan
-        return (f'model-score = {none_to_nan(self.model_score):.2f}, ' 
-                f'keyword-score = {none_to_nan(self.keyword_score):.2f}, ' 
-                f'scrape-order-score = {none_to_nan(self.scrape_order_score):.2f}')
-
-    @classmethod
-    def _extract_numeric_fields(cls, df):
-
-        if not all(col in df.columns
-                   for col in ['days_age', 'salary_low', 'salary_high']):
-            df = df.apply(_extract_numeric_fields_on_row, axis=1)
+        std = lambda name: (f' ± {self.scores_std[name]:.2f}'
+                            if name in self.scores_std else '')
+        return (f'model-score = {none_to_nan(self.model_score):.2f}{std("model")}, ' 
+                f'online-score = {none_to_nan(self.online_score):.2f}, ' 
+                f'keyword-score = {none_to_nan(self.keyword_score):.2f}{std("keyword")}, ' 
+                f'scrape-order-score = '
+                f'{none_to_nan(self.scrape_order_score):.2f}{std("scrape-order")}')
 
-        if not cls.years_experience_col in df.columns:
-            df = _extract_year_experience(df, col_name=cls.years_experience_col)
+    @property
+    def numeric_cols(self):
+        return ['description_length', 'salary_low', 'salary_high', 'days_age',
+                self.years_experience_col]
+
+    def _cached_features(self, df, kind, compute, version=''):
+        if not common.MLParams.features_cache or not len(df):
+            return compute(df)
+        if kind not in self._features_caches:
+            self._features_caches[kind] = features.FeaturesCache(
+                self.task_config.features_cache_path(kind))
+        source_cols = [col for col in [self.description_col, self.title_col,
+                                       'salary', 'date'] if col in df.columns]
+        return self._features_caches[kind].features(
+            df, keys=features.content_keys(df, cols=source_cols),
+            compute=compute, version=version)
+
+    def _calc_numeric_fields(self, df):
+        return features.extract_numeric_fields(df)[self.numeric_cols]
+
+    def _extract_numeric_fields(self, df):
+
+        if not all(col in df.columns for col in self.numeric_cols):
+            numeric = self._cached_features(
+                df, kind='numeric', compute=self._calc_numeric_fields)
+            df = df.assign(
+                description=features.normalized_descriptions(df[self.description_col]),
+                **{col: numeric[col].values for col in numeric.columns})
 
         return df
 
-    def _add_keyword_features(self, df):
-
-        def group_named_regex(word_list, name):
-            return '(?P<%s>' % name + '|'.join(word_list) + ')'
+    def _calc_keyword_features(self, df):
+        matches = []
+        for source in [self.description_col, self.title_col]:
+            groups = {f'{source}_{weight}': self.task_config[f'{source}_{weight}']
+                      for weight in ['positive', 'negative']}
+            matches.append(features.keywords_matcher(groups).match(df[source].values))
+        return pd.concat(matches, axis=1).set_index(df.index)
 
-        for source, weight in product([self.description_col, self.title_col],
-                                      ['positive', 'negative']):
+    def _add_keyword_features(self, df):
 
-            group_kind = f'{source}_{weight}'
-            group_col = group_kind + '_count'
-            group_hits = group_kind + '_hits'
-            keywords = self.task_config[group_kind]
-            group_regex = re.compile(group_named_regex(keywords, group_kind))
+        keywords = {kind: self.task_config[kind] for kind in TaskConfig.KEYWORD_KEYS}
+        matches = self._cached_features(
+            df, kind='keywords', compute=self._calc_keyword_features,
+            version=features.keywords_hash(keywords))
 
-            df[group_hits] = df[source].apply(lambda s: np.unique(re.findall(group_regex, s)))
-            # df[group_hits] = df[source].str.extractall(group_regex).groupby(level=0).agg(set)  # alternative impl
-            df[group_col] = df[source].str.count(group_regex)
+        df = df.assign(**{col: matches[col].values for col in matches.columns})
 
-            if group_col not in self.intermidiate_score_cols:
+        for group_col in matches.columns:
+            if (group_col.endswith('_count') and
+                    group_col not in self.intermidiate_score_cols):
                 self.intermidiate_score_cols.append(group_col)
 
         rank_params = dict(pct=True, ascending=True)
@@ -332,28 +498,124 @@ class JobsRanker(RankerAPI, LogCallsTimeAndOutput):
         return df
 
     def _add_salary_guess(self, df, refit=False):
-        df = self._add_salary_features(df)
-
-        if self.regressor_salary is None or refit:
-            self._train_salary_regressor()
-
-        df[self.salary_guess_col] = (self.regressor_salary.predict(df)
-                                     if self.regressor_salary else 0)
-
-        return df
+        """ :param df: with the salary features (see _add_salary_features) """
+        # check the retrain policy once per data load or config change
+        check_for = (self._data_version, self._model_fingerprint('salary'))
+        if refit or self._salary_checked_for != check_for:
+            self._train_salary_regressor(force=refit)
+            self._salary_checked_for = check_for
+
+        return df.assign(**{self.salary_guess_col: self._predict_salaries(df)})
+
+    def _predict_salaries(self, df):
+        """ predicts only for rows that weren't predicted by the current model """
+        if not self.regressor_salary:
+            return 0
+
+        if self._salary_guesses_model is not self.regressor_salary:
+            self._salary_guesses = pd.Series(dtype=float)
+            self._salary_guesses_model = self.regressor_salary
+
+        keys = features.content_keys(
+            df, cols=self.text_cols + self.num_cols_salary)
+        guesses = self._salary_guesses.reindex(keys)
+        missing = guesses.isna().values
+
+        if missing.any():
+            predicted = self.regressor_salary.predict(df.loc[missing])
+            guesses.values[missing] = predicted
+            new_guesses = pd.Series(predicted, index=keys[missing])
+            self._salary_guesses = self._salary_guesses.append(
+                new_guesses[~new_guesses.index.duplicated()])
+
+        logger.info(f'salary guesses: {missing.sum()} predicted, '
+                    f'{(~missing).sum()} cached')
+        return guesses.values
 
     def _add_salary_features(self, df):
         df = self._extract_numeric_fields(df)
         df = self._add_keyword_features(df)
         return df
 
-    def _train_salary_regressor(self):
+    def _model_fingerprint(self, kind, labels_df=None):
+        """
+        salary model's fingerprint doesn't include the data (crawls) because
+            its retraining depends on how much its training set changed
+        """
+        parts = dict(kind=kind,
+                     task=self.task_config.data_dict(),
+                     ml_params=models_store.ml_params_fingerprint())
+        if kind == 'label':
+            parts.update(label_columns=self.label_regressor_cols)
+        if labels_df is not None:
+            salary_keys = (self.salary_train_keys
+                           if self.salary_train_keys is not None else [])
+            parts.update(crawls=models_store.files_fingerprint(self._crawl_files),
+                         labels=models_store.frame_fingerprint(labels_df),
+                         salary=self._models_fingerprints.get('salary'),
+                         salary_data=models_store.frame_fingerprint(
+                             pd.Series(salary_keys, dtype=str)))
+        return models_store.fingerprint(**parts)
+
+    def _reuse_model(self, kind, fingerprint, still_valid=lambda attrs: True):
+        """
+        sets the model's attributes from memory or from a saved model
+            (if MLParams.persist_models) if these were trained with the same fingerprint
+        :param still_valid: additional check of the model's attributes dict
+        :return: whether the model was reused
+        """
+        if self._models_fingerprints.get(kind) == fingerprint:
+            attrs = {attr: getattr(self, attr) for attr in self.models_attrs[kind]}
+        elif common.MLParams.persist_models:
+            attrs = ModelsStore(self.task_config.model_path(kind)).load(fingerprint)
+        else:
+            attrs = None
+        if attrs is None or not still_valid(attrs):
+            return False
+        logger.info(f'reusing {kind} model')
+        for attr in self.models_attrs[kind]:
+            setattr(self, attr, attrs[attr])
+        self._models_fingerprints[kind] = fingerprint
+        return True
+
+    def _save_model(self, kind, fingerprint):
+        self._models_fingerprints[kind] = fingerprint
+        if common.MLParams.persist_models:
+            ModelsStore(self.task_config.model_path(kind)).save(
+                fingerprint, **{attr: getattr(self, attr)
+                                for attr in self.models_attrs[kind]})
+
+    def _salary_train_changed_ratio(self, train_keys, prev_train_keys):
+        if prev_train_keys is None:
+            return np.inf
+        changed = len(np.setxor1d(train_keys, prev_train_keys, assume_unique=True))
+        return changed / max(len(prev_train_keys), 1)
+
+    def _train_salary_regressor(self, force=False):
+        """
+        retrains the salary regressor only if the salaries training set changed by
+            at least MLParams.salary_retrain_ratio since it was trained (or if forced)
+        """
+        target_col = 'salary_high'
+
         df_train = self.df_all_deduped.copy()
         df_train = self._add_salary_features(df_train)
+        df_train.dropna(subset=self.text_cols + [target_col], inplace=True)
 
-        target_col = 'salary_high'
+        train_keys = np.unique(features.content_keys(
+            df_train, cols=self.text_cols + [target_col]))
+
+        def still_valid(attrs):
+            changed_ratio = self._salary_train_changed_ratio(
+                train_keys, attrs['salary_train_keys'])
+            logger.info(f'salaries training set changed by {changed_ratio:.1%} '
+                        f'since last training')
+            return changed_ratio < common.MLParams.salary_retrain_ratio
+
+        fingerprint = self._model_fingerprint('salary')
+        if not force and self._reuse_model('salary', fingerprint, still_valid=still_valid):
+            return
 
-        df_train.dropna(subset=self.text_cols + [target_col], inplace=True)
         logger.info(f'training with {len(df_train)} salaries')
 
         if len(df_train) >= common.MLParams.min_training_samples:
@@ -368,15 +630,126 @@ class JobsRanker(RankerAPI, LogCallsTimeAndOutput):
             logger.warn(f'Not training salary regressor due to '
                         f'having only {len(df_train)} samples')
 
-    def _add_model_score(self, df, refit=True):
-        df = self._add_relevance_features(df)
-
-        if self.regressor is None or refit:
-            self._train_label_regressor()
-
-        df[self.model_score_col] = (self.regressor.predict(df)
-                                    if self.regressor is not None else 0)
-        return df
+        self.salary_train_keys = train_keys
+        self._save_model('salary', fingerprint)
+
+    def _label_keys(self, df_train):
+        return (df_train.index.astype(str) + '#' +
+                df_train[self.target_col].astype(str)).values
+
+    def _fit_label_regressor(self, df_train):
+        start = time.time()
+
+        text_cols, num_cols = self.label_regressor_cols
+        self.regressor = regression.LGBProbaRegressionPipeline(
+            text_cols=text_cols, num_cols=num_cols)
+
+        model_metrics, baselines_metrics = self.regressor.train_eval(
+            df_train,
+            y_col=self.target_col,
+            target_name='label',
+            baselines=[df_train[self.keyword_score_col],
+                       df_train[self.scrape_order_rank_col]])
+
+        metric = regression.MAIN_METRIC
+        self.model_score = model_metrics[metric]
+        self.keyword_score = baselines_metrics[0][metric]
+        self.scrape_order_score = baselines_metrics[1][metric]
+        self.scores_std = {
+            name: metrics[f'{metric}_std']
+            for name, metrics in [('model', model_metrics),
+                                  ('keyword', baselines_metrics[0]),
+                                  ('scrape-order', baselines_metrics[1])]
+            if f'{metric}_std' in metrics}
+
+        self.label_full_fit = dict(
+            keys=self._label_keys(df_train),
+            oov_ratio=self.regressor.vocabulary_oov_ratio(df_train),
+            seconds=time.time() - start,
+            fingerprint=self._model_fingerprint('label'),
+            warm_starts=0)
+
+    def _fit_online_ranker(self, df_train):
+        self.online_ranker = OnlineRanker(
+            text_cols=self.text_cols, num_cols=self.num_cols_label). \
+            fit(df_train, df_train[self.target_col].values)
+        self.online_score = self.online_ranker.score
+
+    def _warm_start_label_regressor(self, df_train):
+        """
+        continues training the label regressor on the new labels (see
+            regression.LGBRegressionPipeline.warm_start) if the labels only grew
+            by a little, the vocabulary of the new labeled jobs didn't drift, and
+            it wasn't warm started too many times in a row since the last full fit
+            (the model score is refreshed, the baselines scores are of the last full fit)
+        :return: whether the regressor was warm started
+        """
+        if not common.MLParams.lgbm_warm_start:
+            return False
+
+        # task and ml params (without the labels and the data) of the last full fit
+        fingerprint = self._model_fingerprint('label')
+
+        if self.regressor is None and common.MLParams.persist_models:
+            # continue from the last saved model (e.g. after a restart)
+            saved = ModelsStore(self.task_config.model_path('label')).load_latest()
+            if (saved is not None and saved['label_full_fit'] is not None and
+                    saved['label_full_fit'].get('fingerprint') == fingerprint):
+                for attr in self.warm_start_attrs:
+                    setattr(self, attr, saved[attr])
+
+        full_fit = self.label_full_fit
+        if (self.regressor is None or full_fit is None or
+                full_fit.get('fingerprint') != fingerprint or
+                (self.regressor.text_cols, self.regressor.num_cols) !=
+                self.label_regressor_cols):
+            return False
+
+        if full_fit['warm_starts'] >= common.MLParams.warm_start_max_rounds:
+            logger.info(f'full refit of label model: warm started '
+                        f'{full_fit["warm_starts"]} times since the last full fit')
+            return False
+
+        keys = self._label_keys(df_train)
+        new = ~np.isin(keys, full_fit['keys'])
+        if not new.any() or not np.isin(full_fit['keys'], keys).all():
+            # no new labels (other data changed) or labels were changed or removed
+            return False
+
+        growth = new.sum() / len(full_fit['keys'])
+        if growth >= common.MLParams.warm_start_max_labels_growth:
+            logger.info(f'full refit of label model: labels grew by {growth:.1%}')
+            return False
+
+        drift = self.regressor.vocabulary_oov_ratio(df_train.loc[new]) - full_fit['oov_ratio']
+        if drift >= common.MLParams.warm_start_max_vocab_drift:
+            logger.info(f'full refit of label model: vocabulary drifted '
+                        f'(new labels OOV terms ratio higher by {drift:.1%})')
+            return False
+
+        start = time.time()
+        model_metrics = self.regressor.warm_start(
+            df_train, y_col=self.target_col,
+            n_estimators=common.MLParams.lgbm_warm_start_n_estimators,
+            target_name='label')
+        elapsed = time.time() - start
+        self.model_score = model_metrics[regression.MAIN_METRIC]
+        self.scores_std = {name: std for name, std in self.scores_std.items()
+                           if name != 'model'}
+        # a new dict, the previous one may be shared with a memoized or saved model
+        self.label_full_fit = dict(full_fit, warm_starts=full_fit['warm_starts'] + 1)
+        logger.info(f'warm started label model with {new.sum()} new labels '
+                    f'in {elapsed:.2f}s (last full fit took {full_fit["seconds"]:.2f}s, '
+                    f'speedup {full_fit["seconds"] / max(elapsed, 1e-6):.1f}x)')
+        return True
+
+    def _add_model_score(self, df):
+        """ :param df: with the relevance features (see _add_relevance_features) """
+        return df.assign(**{
+            self.model_score_col: (self.regressor.predict(df)
+                                   if self.regressor is not None else 0),
+            self.online_score_col: (self.online_ranker.predict(df)
+                                    if self.online_ranker is not None else 0)})
 
     def _add_relevance_features(self, df):
         df = self._extract_numeric_fields(df)
@@ -384,9 +757,7 @@ class JobsRanker(RankerAPI, LogCallsTimeAndOutput):
         df = self._add_salary_guess(df)
         return df
 
-    def _train_df_with_labels(self):
-
-        deduped_labels = self.labeler.export_df(dedup=True)
+    def _train_df_with_labels(self, deduped_labels):
 
         # using df_all_read with duplicates because can't know which duplicate was labeled
         # but since labeled df will be deduped - we'll have no dups after join
@@ -397,9 +768,9 @@ class JobsRanker(RankerAPI, LogCallsTimeAndOutput):
 
         return df_train
 
-    def _train_label_regressor(self):
-
-        df_train = self._train_df_with_labels()
+    def _labeled_train_df(self, deduped_labels):
+        """ :return: labeled jobs with the relevance features (if enough for training) """
+        df_train = self._train_df_with_labels(deduped_labels)
 
         df_train.dropna(subset=self.text_cols, inplace=True)
 
@@ -408,61 +779,73 @@ class JobsRanker(RankerAPI, LogCallsTimeAndOutput):
 
         if len(df_train) >= common.MLParams.min_training_samples:
             df_train = self._add_relevance_features(df_train)
+        return df_train
 
-            self.regressor = regression.LGBProbaRegressionPipeline(
-                text_cols=self.text_cols, num_cols=self.num_cols_label)
+    def _train_label_regressor(self):
 
-            model_metrics, baselines_metrics = self.regressor.train_eval(
-                df_train,
-                y_col=self.target_col,
-                target_name='label',
-                baselines=[df_train[self.keyword_score_col],
-                           df_train[self.scrape_order_rank_col]])
+        deduped_labels = self.labeler.export_df(dedup=True)
 
-            metric = regression.MAIN_METRIC
-            self.model_score = model_metrics[metric]
-            self.keyword_score = baselines_metrics[0][metric]
-            self.scrape_order_score = baselines_metrics[1][metric]
+        fingerprint = self._model_fingerprint('label', labels_df=deduped_labels)
+        if self._reuse_model('label', fingerprint):
+            return
+
+        df_train = self._labeled_train_df(deduped_labels)
+
+        if len(df_train) >= common.MLParams.min_training_samples:
+            if not self._warm_start_label_regressor(df_train):
+                self._fit_label_regressor(df_train)
+
+            if common.MLParams.online_ranker:
+                self._fit_online_ranker(df_train)
 
         else:
             logger.warn(f'Not training label regressor due to '
                         f'having only {len(df_train)} samples')
 
-
-def _extract_numeric_fields_on_row(row):
-    row['description'] = (
-        str(row['description']).lower().
-            replace('\n', ' ').replace('\t', ' '))
-
-    row['description_length'] = len(row['description'])
-
-    # salary
-    sal_str = str(row['salary'])
-    sal_nums = re.findall('[0-9]+', sal_str.replace(',', ''))
-    sal_mult = (('year' in sal_str) * 1
-                + ('day' in sal_str) * 200
-                + ('hour' in sal_str) * 1600)
-    if len(sal_nums) == 2:
-        row['salary_low'] = float(sal_nums[0]) * sal_mult
-        row['salary_high'] = float(sal_nums[1]) * sal_mult
-
-    # date
-    date_str = str(row['date'])
-    date_nums = re.findall('[0-9]+', date_str)
-    date_mult = (('day' in date_str) * 1
-                 + ('month' in date_str) * 30
-                 + ('hour' in date_str) * 0.04)
-    if len(date_nums) == 1:
-        row['days_age'] = int(int(date_nums[0]) * date_mult)
-    return row
-
-
-def _extract_year_experience(df, col_name):
-    # inspect regexp r'(?P<years>.{1,10}[\d+.{1,3}]?\d+\syears.{1,10})'
-    years_regexp = re.compile(r'(?P<years>\d+)\s*years')
-    df.loc[:, col_name] = (df['description'].str.extractall(years_regexp)
-                           .groupby(level=0)['years'].apply(list)
-                           .apply(lambda l: min([int(el) for el in l])))
-    df.loc[df[col_name] >= 12, col_name] = 0
-    df.loc[df[col_name].isna(), col_name] = 0
-    return df
+        self._save_model('label', fingerprint)
+
+    def select_label_columns(self, background=False):
+        """
+        exhaustive selection of the label regressor's columns on the current labels,
+            the best selection is saved next to the task's models and is used from
+            the next training of the label model
+        :param background: run in a separate thread (doesn't block reranking)
+        """
+        if not background:
+            return self._select_label_columns()
+        if self._selection_future is not None and self._selection_future.running():
+            logger.info('columns selection is already running')
+            return
+        self._selection_future = self._selection_executor.submit(self._select_label_columns)
+        self._selection_future.add_done_callback(_log_future_error)
+
+    def _select_label_columns(self):
+        with self._busy_lock:
+            df_train = self._labeled_train_df(self.labeler.export_df(dedup=True))
+            text_cols, num_cols = self.text_cols, self.num_cols_label
+
+        if len(df_train) < common.MLParams.min_training_samples:
+            logger.warn(f'Not selecting columns due to having only {len(df_train)} samples')
+            return
+
+        metric = regression.MAIN_METRIC
+        _, results = regression.LGBProbaRegressionPipeline.exhaustive_column_selection(
+            text_cols, num_cols,
+            x=df_train[text_cols + num_cols],
+            y=df_train[self.target_col].values,
+            metric=metric,
+            test_ratio=None)
+
+        best = results.iloc[0]
+        label_columns = dict(selected=list(best['cols']),
+                             evaluated=text_cols + num_cols,
+                             score=float(best[metric]),
+                             n_labels=len(df_train),
+                             created=common.current_timestamp())
+        TasksConfigsDao.save_label_columns(self.task_config, label_columns)
+        logger.info(f'saved label model columns selection: {label_columns}')
+
+
+def _log_future_error(future):
+    if future.exception() is not None:
+        logger.error(f'background task failed: {repr(future.exception())}')
@@ -0,0 +1,96 @@
+import time
+
+import pandas as pd
+
+from jobs_ranker.ml import models_store
+from jobs_ranker.utils.instrumentation import LogCallsTimeAndOutput
+from jobs_ranker.utils.logger import logger
+
+
+class Stage:
+    """
+    step of a StagesGraph: func is called with the outputs of the deps stages
+        (in the same order), and its output is memoized on the values of its
+        declared inputs and the keys of its deps
+    """
+
+    def __init__(self, name, func, deps=(), inputs=()):
+        self.name = name
+        self.func = func
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+
+
+class StagesGraph(LogCallsTimeAndOutput):
+    """
+    dependency graph of memoized stages: running a stage only recomputes
+        the stages (it depends on) that were invalidated - if one of their inputs
+        changed, one of their deps was recomputed or they were invalidated explicitly
+
+    :param stages: list of Stage objects in dependency order
+    :param inputs: dict of input name to a function that returns its current
+        value (json serializable, or with a stable str). called at most once per run,
+        and only if a stage that declares that input is reached
+    """
+
+    def __init__(self, stages, inputs):
+        super().__init__()
+        self.stages = {}
+        for stage in stages:
+            undefined = [dep for dep in stage.deps if dep not in self.stages]
+            if undefined:
+                raise ValueError(f'stage "{stage.name}" depends on undefined stages '
+                                 f'{undefined} (stages should be in dependency order)')
+            unknown = [name for name in stage.inputs if name not in inputs]
+            if unknown:
+                raise ValueError(f'stage "{stage.name}" has unknown inputs {unknown}')
+            self.stages[stage.name] = stage
+        self.inputs = inputs
+        self._keys = {}
+        self._outputs = {}
+        self._invalidations = {name: 0 for name in self.stages}
+
+    def _required_stages(self, target):
+        """ :return: names of target and all the stages it depends on, in dependency order """
+        required = {target}
+        for name in reversed(list(self.stages)):
+            if name in required:
+                required.update(self.stages[name].deps)
+        return [name for name in self.stages if name in required]
+
+    def invalidate(self, name):
+        """ forces recomputing a stage (and the stages that depend on it) in the next run """
+        self._invalidations[name] += 1
+
+    def run(self, target):
+        """ :return: output of the target stage """
+        if target not in self.stages:
+            raise ValueError(f'unknown stage "{target}"')
+
+        input_values = {}
+
+        def input_value(name):
+            if name not in input_values:
+                input_values[name] = self.inputs[name]()
+            return input_values[name]
+
+        report = []
+        for name in self._required_stages(target):
+            stage = self.stages[name]
+            key = models_store.fingerprint(
+                inputs={input_name: input_value(input_name) for input_name in stage.inputs},
+                deps=[self._keys[dep] for dep in stage.deps],
+                invalidations=self._invalidations[name])
+
+            if self._keys.get(name) == key:
+                report.append((name, 'memoized', 0.0))
+                continue
+
+            start = time.time()
+            self._outputs[name] = stage.func(*[self._outputs[dep] for dep in stage.deps])
+            self._keys[name] = key
+            report.append((name, 'computed', round(time.time() - start, 3)))
+
+        logger.info(f'stages for "{target}":\n'
+                    f'{pd.DataFrame(report, columns=["stage", "status", "seconds"])}')
+        return self._outputs[target]
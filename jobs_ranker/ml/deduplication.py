@@ -1,50 +1,514 @@
+import collections
 import itertools
-from collections import defaultdict
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
+import pandas as pd
+import scipy.sparse
+from scipy.sparse.csgraph import connected_components
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 
 from jobs_ranker.config import common
-from jobs_ranker.utils.instrumentation import log_time_and_shape
+from jobs_ranker.utils.instrumentation import log_time_and_shape, LogCallsTimeAndOutput
+from jobs_ranker.utils.logger import logger
+from jobs_ranker.utils.parallel import SharedCSR
+
+_HASH_PRIME = (1 << 31) - 1  # for universal hashing of shingles in MinHash
 
 
 @log_time_and_shape
-def calc_duplicates(strings, keep='first'):
+def calc_duplicates(strings, keep='first', keys=None, dedup_index=None):
+    """
+    duplicates are grouped transitively (connected components of the duplicates
+    pairs graph), so if A~B and B~C all three are in the same group.
+
+    :param keys: unique content keys of the strings, required with dedup_index
+    :param dedup_index: optional DedupIndex, if provided only the strings
+        with keys that are not yet in the index are vectorized and matched
+    :return: (keep_inds, group_ids) - sorted indices of one string to keep
+        per group, and the group id (0 to n_groups - 1) of each string
+    """
 
     if keep not in ['first', 'last']:
         raise ValueError(f'keep value can only be "first" or "last"')
 
     strings = np.array(strings).astype(str)
-    dup_i, dup_j = duplicates_by_tfidf_cosine(strings)
+    if dedup_index is not None:
+        dedup_index.update(keys, strings)
+        dup_i, dup_j = dedup_index.duplicates(keys)
+    else:
+        dup_i, dup_j = _dedup_method()(strings)
 
-    dup_dict_inds = defaultdict(set)
-    for i, j in zip(dup_i, dup_j):
-        dup_dict_inds[i].add(j)
-        dup_dict_inds[j].add(i)
+    n = len(strings)
+    graph = scipy.sparse.coo_matrix(
+        (np.ones(len(dup_i), dtype=bool), (dup_i, dup_j)), shape=(n, n))
+    n_groups, group_ids = connected_components(graph, directed=False)
 
-    keep_inds = set()
-    keep_i = 0 if keep == 'first' else -1
-    for i in range(len(strings)):
-        keep_inds.add(sorted([i] + list(dup_dict_inds[i]))[keep_i])
+    inds = np.arange(n)
+    if keep == 'first':
+        keep_inds = np.full(n_groups, n)
+        np.minimum.at(keep_inds, group_ids, inds)
+    else:
+        keep_inds = np.full(n_groups, -1)
+        np.maximum.at(keep_inds, group_ids, inds)
 
-    return sorted(list(keep_inds)), dup_dict_inds
+    return np.sort(keep_inds), group_ids
 
 
-@log_time_and_shape
-def duplicates_by_tfidf_cosine(strings):
+class DuplicatesGroups:
+    """
+    compact lookups for duplicates groups: url -> group id and group id -> urls
+    """
+
+    def __init__(self, urls, group_ids):
+        self.urls = np.asarray(urls)
+        self.group_ids = np.asarray(group_ids)
+        self._url_to_group = pd.Series(self.group_ids, index=self.urls)
+        self._url_to_group = self._url_to_group[
+            ~self._url_to_group.index.duplicated(keep='last')]
+        self._url_to_group_dict = None
+        self._members_order = np.argsort(self.group_ids, kind='stable')
+        self._group_starts = np.searchsorted(
+            self.group_ids[self._members_order],
+            np.arange(self.group_ids.max() + 2 if len(self.group_ids) else 1))
+
+    def __len__(self):
+        return len(self._group_starts) - 1
+
+    def group_of(self, url):
+        """ :return: group id or None if url is unknown """
+        if self._url_to_group_dict is None:
+            # for single lookups, which are much slower with the series
+            self._url_to_group_dict = dict(zip(self._url_to_group.index,
+                                               self._url_to_group.values.tolist()))
+        return self._url_to_group_dict.get(url)
+
+    def groups_of(self, urls):
+        """ :return: array of group ids of urls, -1 for unknown urls """
+        return (self._url_to_group.reindex(np.asarray(urls))
+                .fillna(-1).astype(int).values)
+
+    def members(self, group):
+        start, end = self._group_starts[group], self._group_starts[group + 1]
+        return self.urls[self._members_order[start:end]]
+
+    def urls_with_dups(self, url):
+        """ :return: all urls in the group of the url (including it) """
+        group = self.group_of(url)
+        return self.members(group) if group is not None else np.array([url])
+
+    def duplicates_of(self, url):
+        """ :return: the other urls in the group of the url """
+        urls = self.urls_with_dups(url)
+        return urls[urls != url]
+
+
+def _dedup_method():
+    methods = {
+        'tfidf_cosine': duplicates_by_tfidf_cosine,
+        'minhash_lsh': duplicates_by_minhash_lsh,
+    }
+    method = common.MLParams.dedup_method
+    if method not in methods:
+        raise ValueError(f'dedup_method can only be one of {list(methods)}, '
+                         f'got "{method}"')
+    return methods[method]
+
+
+def _dedup_params():
+    # params that affect the found duplicates
+    return {name: getattr(common.MLParams, name) for name in [
+        'features_dtype',
+        'dedup_method',
+        'dedup_tfidf_ngram_range',
+        'dedup_tfidf_max_df_cutoff',
+        'dedup_tfidf_max_df_ratio',
+        'dedup_simil_thershold',
+        'dedup_minhash_n_perm',
+        'dedup_lsh_n_bands',
+    ]}
+
+
+def _tfidf_vectorizer(n_docs):
     max_docs_cutoff = max(common.MLParams.dedup_tfidf_max_df_cutoff,
-                          int(len(strings) * common.MLParams.dedup_tfidf_max_df_ratio))
-    tf = TfidfVectorizer(
+                          int(n_docs * common.MLParams.dedup_tfidf_max_df_ratio))
+    return TfidfVectorizer(
         ngram_range=common.MLParams.dedup_tfidf_ngram_range,
         max_df=max_docs_cutoff,
-        stop_words='english')
-    vecs = tf.fit_transform(strings)
-    simil_mat = cosine_similarity(vecs)
-    simil_mat -= np.eye(*simil_mat.shape)
-    threshold = common.MLParams.dedup_simil_thershold
-    dup_i, dup_j = np.where(simil_mat > threshold)
-    return dup_i, dup_j
+        stop_words='english',
+        dtype=np.dtype(common.MLParams.features_dtype))
+
+
+def _tfidf_vectors(strings):
+    return _tfidf_vectorizer(len(strings)).fit_transform(strings)
+
+
+@log_time_and_shape
+def duplicates_by_tfidf_cosine(strings):
+    vecs = _tfidf_vectors(strings)
+    return similar_pairs(vecs)
+
+
+@log_time_and_shape
+def duplicates_by_minhash_lsh(strings):
+    """
+    near linear alternative to duplicates_by_tfidf_cosine: candidate pairs are
+    documents that share a band of their MinHash signatures (over the same
+    shingles that are used for the tfidf vectors), and the candidates are then
+    verified with the exact tfidf cosine similarity and threshold.
+    """
+    vecs = _tfidf_vectors(strings)
+    signatures, signed_rows = minhash_signatures(
+        vecs, n_perm=common.MLParams.dedup_minhash_n_perm)
+    return symmetric_pairs(*verified_lsh_pairs(vecs, signatures, signed_rows))
+
+
+def verified_lsh_pairs(vecs, signatures, signed_rows, min_row=0):
+    """
+    :param min_row: only pairs with at least one row index >= min_row are checked
+    :return: (pairs_i, pairs_j) LSH candidates (pairs_i < pairs_j) that are above
+        the cosine similarity threshold
+    """
+    cand_i, cand_j = lsh_candidate_pairs(
+        signatures, n_bands=common.MLParams.dedup_lsh_n_bands)
+    cand_i, cand_j = signed_rows[cand_i], signed_rows[cand_j]
+    relevant = cand_j >= min_row
+    cand_i, cand_j = cand_i[relevant], cand_j[relevant]
+    simil = rows_cosine_similarity(vecs, cand_i, cand_j)
+    dups = simil > common.MLParams.dedup_simil_thershold
+    return cand_i[dups], cand_j[dups]
+
+
+def minhash_signatures(vecs, n_perm, seed=0):
+    """
+    MinHash signatures of the sets of nonzero columns (shingles) of each row,
+    using universal hashing of the column indices as the permutations.
+
+    :return: (signatures, rows) - signatures matrix of shape (n_rows, n_perm)
+        for the non-empty rows only, and the indices of those rows
+    """
+    vecs = vecs.tocsr()
+    rows = np.flatnonzero(np.diff(vecs.indptr))
+    signatures = np.empty((len(rows), n_perm), dtype=np.uint32)
+    if not len(rows):
+        return signatures, rows
+
+    rand = np.random.RandomState(seed)
+    a_params = rand.randint(1, _HASH_PRIME, size=n_perm, dtype=np.int64)
+    b_params = rand.randint(0, _HASH_PRIME, size=n_perm, dtype=np.int64)
+    shingles = vecs.indices.astype(np.int64)
+    row_starts = vecs.indptr[rows]
+    for k, (a, b) in enumerate(zip(a_params, b_params)):
+        hashes = (a * shingles + b) % _HASH_PRIME
+        signatures[:, k] = np.minimum.reduceat(hashes, row_starts)
+    return signatures, rows
+
+
+def lsh_candidate_pairs(signatures, n_bands):
+    """
+    locality sensitive hashing of MinHash signatures: rows that have identical
+    signature values in at least one of the n_bands bands are candidates.
+
+    :return: (cand_i, cand_j) unique candidate pairs with cand_i < cand_j
+    """
+    n_rows, n_perm = signatures.shape
+    if n_perm % n_bands:
+        raise ValueError(f'number of permutations ({n_perm}) should be '
+                         f'divisible by number of bands ({n_bands})')
+    band_width = n_perm // n_bands
+    # random multipliers for hashing a band's values into a single bucket key
+    mults = np.random.RandomState(0).randint(
+        1, np.iinfo(np.int64).max, size=band_width, dtype=np.int64).astype(np.uint64)
+    pair_codes = [np.array([], dtype=np.int64)]
+    for start in range(0, n_perm, band_width):
+        band = signatures[:, start:start + band_width].astype(np.uint64)
+        buckets = (band * mults).sum(axis=1)  # wraps around on overflow
+        pair_codes.append(_pairs_codes_within_groups(buckets, n_rows))
+    pair_codes = np.unique(np.concatenate(pair_codes))
+    return pair_codes // n_rows, pair_codes % n_rows
+
+
+def _pairs_codes_within_groups(group_ids, n_rows):
+    # pairs (i < j) of members of same group encoded as i * n_rows + j,
+    # by pairing each member with the members at increasing offsets after it
+    order = np.argsort(group_ids, kind='stable').astype(np.int64)
+    sorted_ids = group_ids[order]
+    codes = [np.array([], dtype=np.int64)]
+    for offset in range(1, len(order)):
+        same = sorted_ids[offset:] == sorted_ids[:-offset]
+        if not same.any():
+            break
+        rows_i, rows_j = order[:-offset][same], order[offset:][same]
+        codes.append(np.minimum(rows_i, rows_j) * n_rows +
+                     np.maximum(rows_i, rows_j))
+    return np.concatenate(codes)
+
+
+def rows_cosine_similarity(vecs, rows_i, rows_j, chunk_size=100000):
+    """ cosine similarities of pairs of (L2 normalised) rows """
+    simil = np.empty(len(rows_i), dtype=float)
+    for start in range(0, len(rows_i), chunk_size):
+        end = start + chunk_size
+        simil[start:end] = np.asarray(
+            vecs[rows_i[start:end]].multiply(vecs[rows_j[start:end]]).sum(axis=1)
+        ).ravel()
+    return simil
+
+
+def similar_pairs_parallel(vecs, threshold, chunk_size, n_jobs, start_row=0):
+    """
+    same output as similar_pairs_chunked, but the rows are split into blocks of
+    chunk_size, and the similarities of each pair of blocks (upper triangle only)
+    are computed in a pool of n_jobs worker processes that share the matrix
+    through memory mapped files.
+    """
+    blocks = range(0, vecs.shape[0], chunk_size)
+    tasks = [(block_i, block_j, chunk_size, threshold, start_row)
+             for block_j in blocks if block_j + chunk_size > start_row
+             for block_i in blocks if block_i <= block_j]
+    with SharedCSR(vecs) as shared, \
+            ProcessPoolExecutor(max_workers=n_jobs,
+                                initializer=_init_similarity_worker,
+                                initargs=(shared,)) as pool:
+        results = list(pool.map(_block_pair_similar_pairs, tasks,
+                                chunksize=max(1, len(tasks) // (4 * n_jobs))))
+    pairs_i = np.concatenate([np.array([], dtype=np.int64)] + [r[0] for r in results])
+    pairs_j = np.concatenate([np.array([], dtype=np.int64)] + [r[1] for r in results])
+    return symmetric_pairs(pairs_i, pairs_j)
+
+
+_worker_vecs = None
+
+
+def _init_similarity_worker(shared):
+    global _worker_vecs
+    _worker_vecs = shared.load()
+
+
+def _block_pair_similar_pairs(task):
+    # pairs (i < j) from the block pair that are above the threshold,
+    # and with j >= start_row
+    block_i, block_j, chunk_size, threshold, start_row = task
+    simil_block = (_worker_vecs[block_i:block_i + chunk_size] @
+                   _worker_vecs[block_j:block_j + chunk_size].T).tocoo()
+    rows = simil_block.row.astype(np.int64) + block_i
+    cols = simil_block.col.astype(np.int64) + block_j
+    mask = (simil_block.data > threshold) & (rows < cols) & (cols >= start_row)
+    return rows[mask], cols[mask]
+
+
+def symmetric_pairs(pairs_i, pairs_j):
+    """ both directions of each pair ordered by row and then by column """
+    dup_i = np.concatenate([pairs_i, pairs_j])
+    dup_j = np.concatenate([pairs_j, pairs_i])
+    order = np.lexsort((dup_j, dup_i))
+    return dup_i[order], dup_j[order]
+
+
+def similar_pairs(vecs, start_row=0):
+    """
+    pairs of rows above MLParams.dedup_simil_thershold, computed in
+    MLParams.dedup_n_jobs processes if more than one.
+    see similar_pairs_chunked for arguments and output.
+    """
+    params = common.MLParams
+    if params.dedup_n_jobs > 1:
+        return similar_pairs_parallel(vecs,
+                                      threshold=params.dedup_simil_thershold,
+                                      chunk_size=params.dedup_chunk_size,
+                                      n_jobs=params.dedup_n_jobs,
+                                      start_row=start_row)
+    else:
+        return similar_pairs_chunked(vecs,
+                                     threshold=params.dedup_simil_thershold,
+                                     chunk_size=params.dedup_chunk_size,
+                                     start_row=start_row)
+
+
+def similar_pairs_chunked(vecs, threshold, chunk_size, start_row=0):
+    """
+    finds all pairs of (L2 normalised) rows with cosine similarity above threshold
+    without materialising the dense n x n similarity matrix: similarities are
+    computed as sparse products for blocks of chunk_size rows against all rows
+    and only the pairs above the threshold are kept from each block.
+
+    :param start_row: only the rows from start_row onwards are matched (against all)
+    :return: (dup_i, dup_j) symmetric indices arrays (without self pairs),
+        ordered by row and then by column (same as np.where on the full matrix)
+    """
+    vecs_t = vecs.T.tocsr()
+    dup_i, dup_j = [], []
+    for start in range(start_row, vecs.shape[0], chunk_size):
+        simil_block = (vecs[start:start + chunk_size] @ vecs_t).tocoo()
+        mask = ((simil_block.data > threshold) &
+                (simil_block.row + start != simil_block.col))
+        dup_i.append(simil_block.row[mask] + start)
+        dup_j.append(simil_block.col[mask])
+    dup_i = np.concatenate(dup_i) if dup_i else np.array([], dtype=int)
+    dup_j = np.concatenate(dup_j) if dup_j else np.array([], dtype=int)
+    order = np.lexsort((dup_j, dup_i))
+    return dup_i[order], dup_j[order]
+
+
+class DedupIndex(LogCallsTimeAndOutput):
+    """
+    persisted index of the dedup vectors (and MinHash signatures) and of the
+    duplicate pairs found so far. Documents are identified by unique content keys,
+    only documents with new keys are vectorized and matched against the index.
+    New documents are vectorized with the idf weights of the last fit, and their
+    shingles that are not in the vocabulary are added to it (with idf weights from
+    their frequency in the added documents), so that they count in the vectors'
+    norms and in the similarities between new documents.
+    The vectorizer is refitted and the index rebuilt once it grows by more than
+    MLParams.dedup_index_refit_ratio or when the dedup params change.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self.params = None
+        self.vectorizer = None
+        self.vocabulary = None
+        self.idf = None
+        self.cut_terms = None
+        self.n_fitted = 0
+        self.keys = np.array([], dtype=str)
+        self.vecs = None
+        self.signatures = None
+        self.signed_rows = None
+        self.pairs_i = np.array([], dtype=np.int64)
+        self.pairs_j = np.array([], dtype=np.int64)
+
+    @classmethod
+    def load(cls, path):
+        if os.path.exists(path):
+            try:
+                with open(path, 'rb') as f:
+                    index = pickle.load(f)
+                index.path = path
+                return index
+            except Exception as e:
+                logger.error(f'failed loading dedup index from {path}, '
+                             f'starting a new one ({repr(e)})')
+        return cls(path)
+
+    def save(self):
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path)
+
+    def _needs_rebuild(self, n_new):
+        return (getattr(self, 'vocabulary', None) is None or  # also for older indices
+                self.params != _dedup_params() or
+                (len(self.keys) + n_new >
+                 self.n_fitted * (1 + common.MLParams.dedup_index_refit_ratio)))
+
+    def update(self, keys, strings):
+        keys = np.asarray(keys).astype(str)
+        is_new = pd.Index(self.keys).get_indexer(keys) == -1
+        if self._needs_rebuild(n_new=is_new.sum()):
+            logger.info(f'rebuilding dedup index with {len(keys)} documents')
+            self._rebuild(keys, np.asarray(strings))
+        else:
+            logger.info(f'adding {is_new.sum()} new documents to dedup index '
+                        f'of {len(self.keys)}')
+            self._add(keys[is_new], np.asarray(strings)[is_new])
+
+    def _rebuild(self, keys, strings):
+        self.params = _dedup_params()
+        self.vectorizer = _tfidf_vectorizer(len(strings))
+        self.vecs = self.vectorizer.fit_transform(strings)
+        # the vectorizer is only used for its analyzer from here, the vocabulary
+        # is extended with the shingles of new documents
+        self.vocabulary = self.vectorizer.vocabulary_
+        self.idf = self.vectorizer.idf_.astype(self.vecs.dtype)
+        # terms that were too frequent (max_df) and are excluded from the vectors
+        self.cut_terms = self.vectorizer.stop_words_
+        self.vectorizer.stop_words_ = None
+        self.keys = keys
+        self.n_fitted = len(keys)
+        self.signatures = np.empty((0, common.MLParams.dedup_minhash_n_perm),
+                                   dtype=np.uint32)
+        self.signed_rows = np.array([], dtype=np.int64)
+        self.pairs_i = np.array([], dtype=np.int64)
+        self.pairs_j = np.array([], dtype=np.int64)
+        self._add_pairs(start_row=0)
+
+    def _add(self, keys, strings):
+        if not len(keys):
+            return
+        start_row = len(self.keys)
+        new_vecs = self._transform(strings)
+        self.vecs = scipy.sparse.vstack(
+            [self._with_n_cols(self.vecs, new_vecs.shape[1]), new_vecs], format='csr')
+        self.keys = np.concatenate([self.keys, keys])
+        self._add_pairs(start_row=start_row)
+
+    def _transform(self, strings):
+        """
+        same as the fitted vectorizer's transform, except that the shingles that
+        are not in the vocabulary are added to it instead of being ignored
+        """
+        analyzer = self.vectorizer.build_analyzer()
+        n_vocab = len(self.vocabulary)
+        indptr, indices, counts = [0], [], []
+        for string in strings:
+            doc_counts = collections.Counter(
+                term for term in analyzer(string) if term not in self.cut_terms)
+            for term, count in doc_counts.items():
+                indices.append(self.vocabulary.setdefault(term, len(self.vocabulary)))
+                counts.append(count)
+            indptr.append(len(indices))
+        indices = np.asarray(indices, dtype=np.int64)
+        # smooth idf of the new terms as if the documents were added to the fitted ones
+        new_terms_df = np.bincount(indices[indices >= n_vocab] - n_vocab,
+                                   minlength=len(self.vocabulary) - n_vocab)
+        new_terms_idf = np.log((1 + self.n_fitted + len(strings)) / (1 + new_terms_df)) + 1
+        self.idf = np.concatenate([self.idf, new_terms_idf.astype(self.idf.dtype)])
+        vecs = scipy.sparse.csr_matrix(
+            (np.asarray(counts, dtype=self.idf.dtype) * self.idf[indices], indices, indptr),
+            shape=(len(strings), len(self.vocabulary)))
+        vecs.sort_indices()
+        return normalize(vecs)
+
+    @staticmethod
+    def _with_n_cols(vecs, n_cols):
+        return scipy.sparse.csr_matrix((vecs.data, vecs.indices, vecs.indptr),
+                                       shape=(vecs.shape[0], n_cols))
+
+    def _add_pairs(self, start_row):
+        if self.params['dedup_method'] == 'minhash_lsh':
+            signatures, signed_rows = minhash_signatures(
+                self.vecs[start_row:], n_perm=common.MLParams.dedup_minhash_n_perm)
+            self.signatures = np.concatenate([self.signatures, signatures])
+            self.signed_rows = np.concatenate([self.signed_rows, signed_rows + start_row])
+            pairs_i, pairs_j = verified_lsh_pairs(
+                self.vecs, self.signatures, self.signed_rows, min_row=start_row)
+        else:
+            dup_i, dup_j = similar_pairs(self.vecs, start_row=start_row)
+            # new rows are matched against all rows, so each pair
+            # appears at least once as (higher, lower)
+            lower = dup_j < dup_i
+            pairs_i, pairs_j = dup_j[lower], dup_i[lower]
+        self.pairs_i = np.concatenate([self.pairs_i, pairs_i])
+        self.pairs_j = np.concatenate([self.pairs_j, pairs_j])
+
+    def duplicates(self, keys):
+        """
+        :return: (dup_i, dup_j) symmetric duplicates pairs between the indices of
+            keys (approximately the same as duplicates_by_tfidf_cosine for the
+            corresponding strings, see benchmarks/dedup_incremental.py)
+        """
+        positions = np.full(len(self.keys), -1, dtype=np.int64)
+        index_rows = pd.Index(self.keys).get_indexer(np.asarray(keys).astype(str))
+        positions[index_rows[index_rows >= 0]] = np.flatnonzero(index_rows >= 0)
+        pos_i, pos_j = positions[self.pairs_i], positions[self.pairs_j]
+        present = (pos_i >= 0) & (pos_j >= 0)
+        return symmetric_pairs(pos_i[present], pos_j[present])
 
 
 def inspect_simil_threshold(strings, simil_mat, threshold):
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from jobs_ranker.config import common
+from jobs_ranker.utils.instrumentation import LogCallsTimeAndOutput
+from jobs_ranker.utils.logger import logger
+
+# bump when the pickled models' classes or features change incompatibly
+MODELS_FORMAT_VERSION = 2
+
+
+def fingerprint(**parts):
+    """ :return: hash of the json representation of the (keyword) parts """
+    return hashlib.md5(
+        json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def frame_fingerprint(df):
+    """
+    :return: hash of the contents of a DataFrame (or a Series), regardless of its
+        index and of the order of its rows and columns
+    """
+    if isinstance(df, pd.DataFrame):
+        df = df[sorted(df.columns)]
+    rows_hashes = pd.util.hash_pandas_object(df, index=False).values
+    return hashlib.md5(np.sort(rows_hashes).tobytes()).hexdigest()
+
+
+def files_fingerprint(paths):
+    """ :return: hash of the names, sizes and modification times of files """
+    stats = [(os.path.basename(path), os.stat(path).st_size, os.stat(path).st_mtime)
+             for path in paths]
+    return fingerprint(files=stats)
+
+
+def ml_params_fingerprint():
+    return fingerprint(**{k: v for k, v in vars(common.MLParams).items()
+                          if not k.startswith('_')})
+
+
+class ModelsStore(LogCallsTimeAndOutput):
+    """
+    persists trained models (and their scores) to disk together with the
+    fingerprint of everything they were trained from, so that they can be reused
+    instead of retraining if the fingerprint matches
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    def _load_saved(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                saved = pickle.load(f)
+        except Exception as e:
+            logger.error(f'failed loading model {self.path} ({repr(e)})')
+            return None
+        if saved.get('format_version') != MODELS_FORMAT_VERSION:
+            return None
+        return saved
+
+    def load(self, fingerprint):
+        """
+        :return: dict of the saved objects or None if there isn't
+            a saved model for this fingerprint
+        """
+        saved = self._load_saved()
+        if saved is None or saved.get('fingerprint') != fingerprint:
+            logger.info(f'saved model {os.path.basename(self.path)} is missing or outdated')
+            return None
+        logger.info(f'loaded saved model {os.path.basename(self.path)}')
+        return saved['objects']
+
+    def load_latest(self):
+        """
+        :return: dict of the saved objects regardless of their fingerprint
+            (e.g. for continuing training) or None if there isn't a saved model
+        """
+        saved = self._load_saved()
+        return saved['objects'] if saved is not None else None
+
+    def save(self, fingerprint, **objects):
+        """
+        :param fingerprint: fingerprint of the training data and parameters
+        :param objects: models and scores to save
+        """
+        saved = dict(format_version=MODELS_FORMAT_VERSION,
+                     fingerprint=fingerprint,
+                     created=common.current_timestamp(),
+                     objects=objects)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'wb') as f:
+            pickle.dump(saved, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.path)
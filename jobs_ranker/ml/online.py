@@ -0,0 +1,96 @@
+import numpy as np
+import scipy.sparse
+import scipy.stats
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.linear_model import SGDRegressor
+from sklearn.preprocessing import StandardScaler
+
+from jobs_ranker.config import common
+from jobs_ranker.utils.instrumentation import LogCallsTimeAndOutput
+
+
+class OnlineRanker(LogCallsTimeAndOutput):
+    """
+    light linear model (hashed text n-grams and scaled numeric features,
+    SGD regression) that can be updated with single labels in milliseconds,
+    for re-ranking between the (slower) fits of the main regression pipeline.
+
+    score is the progressive validation spearman: each label is predicted
+    before the model is updated with it.
+    """
+    _batch_size = 20
+
+    def __init__(self, text_cols, num_cols):
+        super().__init__()
+        self.text_cols = text_cols
+        self.num_cols = num_cols
+        # stateless, so there's no vocabulary to refit when new terms show up
+        self.vectorizer = HashingVectorizer(
+            n_features=2 ** common.MLParams.online_hash_bits,
+            ngram_range=common.MLParams.online_ngram_range,
+            stop_words='english',
+            alternate_sign=False)
+        self.scaler = StandardScaler()
+        self.reg = SGDRegressor(alpha=common.MLParams.online_sgd_alpha,
+                                random_state=0)
+        self._y_seen = []
+        self._y_pred = []
+
+    @property
+    def n_seen(self):
+        return len(self._y_seen)
+
+    @property
+    def score(self):
+        if self.n_seen < common.MLParams.min_training_samples:
+            return None
+        return scipy.stats.spearmanr(self._y_seen, self._y_pred)[0]
+
+    def _nums(self, df):
+        return df[self.num_cols].values.astype(float)
+
+    def transform_texts(self, df):
+        """
+        :return: hashed text features, these don't change when the model is
+            updated, so can be reused for repeated predictions on the same rows
+        """
+        return scipy.sparse.hstack(
+            [self.vectorizer.transform(df[col].astype(str).values)
+             for col in self.text_cols], format='csr')
+
+    def _transform(self, df, texts=None):
+        if texts is None:
+            texts = self.transform_texts(df)
+        nums = np.nan_to_num(self.scaler.transform(self._nums(df)))
+        return scipy.sparse.hstack([texts, nums], format='csr')
+
+    def predict(self, df, texts=None):
+        """ :param texts: precomputed transform_texts(df) """
+        if not self.n_seen:
+            return np.zeros(len(df))
+        return self.reg.predict(self._transform(df, texts=texts))
+
+    def partial_fit(self, df, y):
+        """ updates the model with new labels (after predicting them for the score) """
+        y = np.asarray(y, dtype=float)
+        self._y_pred.extend(self.predict(df))
+        self._y_seen.extend(y)
+        self.scaler.partial_fit(self._nums(df))
+        self.reg.partial_fit(self._transform(df), y)
+
+    def fit(self, df, y, n_epochs=None):
+        """
+        fits on all labels: one progressive pass in batches (in labeling order),
+            and additional passes over the shuffled data
+        """
+        y = np.asarray(y, dtype=float)
+        for start in range(0, len(df), self._batch_size):
+            self.partial_fit(df.iloc[start:start + self._batch_size],
+                             y[start:start + self._batch_size])
+
+        x = self._transform(df)
+        rng = np.random.RandomState(0)
+        for _ in range((n_epochs or common.MLParams.online_n_epochs) - 1):
+            order = rng.permutation(len(y))
+            self.reg.partial_fit(x[order], y[order])
+        return self
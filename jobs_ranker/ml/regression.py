@@ -1,21 +1,27 @@
 import abc
+import functools
 import itertools
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pandas as pd
+import scipy.sparse
 import scipy.stats
 from lightgbm import LGBMRegressor
-from sklearn.base import RegressorMixin
+from sklearn.base import RegressorMixin, clone
 from sklearn.ensemble import RandomForestRegressor
-from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.feature_extraction import FeatureHasher
+from sklearn.feature_extraction.text import (
+    HashingVectorizer, TfidfTransformer, TfidfVectorizer)
 from sklearn.metrics import r2_score, roc_auc_score, average_precision_score
-from sklearn.model_selection import train_test_split
+from sklearn.model_selection import KFold, train_test_split
 from sklearn.pipeline import Pipeline, FeatureUnion
 from sklearn.preprocessing import FunctionTransformer
 
 from jobs_ranker.config import common
 from jobs_ranker.utils.instrumentation import LogCallsTimeAndOutput
 from jobs_ranker.utils.logger import logger
+from jobs_ranker.utils.parallel import SharedCSR
 
 SPEARMAN = 'spearman'
 R2 = 'r2'
@@ -34,11 +40,80 @@ class FunctionTransformerFeatNames(FunctionTransformer, LogCallsTimeAndOutput):
 
 class PipelineFeatNames(Pipeline, LogCallsTimeAndOutput):
 
+    def _named_step(self):
+        # last step that has feature names (e.g. before a TfidfTransformer)
+        return [step for _, step in self.steps
+                if hasattr(step, 'get_feature_names')][-1]
+
+    def get_feature_names(self):
+        return [n for n in self._named_step().get_feature_names()]
+
+    def feature_name_getter(self):
+        """ :return: function from feature index to name (without listing all names if possible) """
+        named_step = self._named_step()
+        if hasattr(named_step, 'feature_names_lookup'):
+            lookup = named_step.feature_names_lookup()
+            return lambda ind: lookup.get(ind, f'hash_{ind}')
+        return named_step.get_feature_names().__getitem__
+
+
+class TfidfVectorizerNoPruned(TfidfVectorizer):
+    """
+    TfidfVectorizer that doesn't keep the terms pruned by min_df / max_df
+    (stop_words_, only for introspection), which are usually more than the vocabulary
+    """
+
+    def fit_transform(self, raw_documents, y=None):
+        x = super().fit_transform(raw_documents, y)
+        if hasattr(self, 'stop_words_'):
+            del self.stop_words_
+        return x
+
+    def fit(self, raw_documents, y=None):
+        self.fit_transform(raw_documents, y)
+        return self
+
+
+class HashingVectorizerFeatNames(HashingVectorizer):
+    """
+    HashingVectorizer (no vocabulary, fixed number of features) that keeps a small
+    sample of the fitted documents for reverse lookup of the feature names
+    """
+    names_sample_size = 200
+
+    def fit(self, X, y=None):
+        self.names_sample_ = list(X[:self.names_sample_size])
+        return self
+
+    def fit_transform(self, X, y=None):
+        return self.fit(X).transform(X)
+
+    def feature_names_lookup(self):
+        """
+        :return: dict of feature index to the terms from the sample that are hashed
+            into it ('|' separated for collisions)
+        """
+        analyzer = self.build_analyzer()
+        terms = sorted(set(itertools.chain.from_iterable(
+            analyzer(doc) for doc in self.names_sample_)))
+        # same hashing as in HashingVectorizer.transform
+        indices = FeatureHasher(
+            n_features=self.n_features, input_type='string',
+            alternate_sign=self.alternate_sign).transform([[t] for t in terms]).indices
+        lookup = {}
+        for term, ind in zip(terms, indices):
+            lookup[ind] = (lookup[ind] + '|' + term) if ind in lookup else term
+        return lookup
+
     def get_feature_names(self):
-        return [n for n in self.steps[-1][1].get_feature_names()]
+        """ :return: names of all features, named by index if not in the sample """
+        lookup = self.feature_names_lookup()
+        return [lookup.get(i, f'hash_{i}') for i in range(self.n_features)]
 
 
 class RegPipelineBase(abc.ABC, LogCallsTimeAndOutput):
+    # regressor fit parameters for evaluation fits
+    _eval_fit_params = {}
 
     def __init__(self, text_cols, num_cols):
         super().__init__()
@@ -63,41 +138,99 @@ class RegPipelineBase(abc.ABC, LogCallsTimeAndOutput):
 
     @staticmethod
     def _tfidf_pipe(col):
+        extract_docs = ('extract_docs', FunctionTransformerFeatNames(
+            functools.partial(column_values, col=col), name=col, validate=False))
+
+        if common.MLParams.reg_text_features == 'hashing':
+            # bounded memory: no vocabulary, only the idf weights per hashed feature
+            return PipelineFeatNames([
+                extract_docs,
+                ('hashing_' + col, HashingVectorizerFeatNames(
+                    n_features=common.MLParams.reg_hashing_n_features,
+                    ngram_range=common.MLParams.reg_tfidf_ngram_range,
+                    stop_words='english',
+                    alternate_sign=False,
+                    norm=None,
+                    dtype=np.dtype(common.MLParams.features_dtype))),
+                ('tfidf_' + col, TfidfTransformer())])
+
         return PipelineFeatNames([
-            ('extract_docs', FunctionTransformerFeatNames(
-                lambda x: x[col].values, name=col, validate=False)),
-            ('tfidf_' + col, TfidfVectorizer(
+            extract_docs,
+            ('tfidf_' + col, TfidfVectorizerNoPruned(
                 ngram_range=common.MLParams.reg_tfidf_ngram_range,
                 min_df=common.MLParams.reg_tfidf_min_df,
-                stop_words='english'))])
+                stop_words='english',
+                dtype=np.dtype(common.MLParams.features_dtype)))])
 
     @staticmethod
     def _noop_pipe(col):
         return PipelineFeatNames([
             ('noop_' + col, FunctionTransformerFeatNames(
-                lambda x: x[col].values.reshape(-1, 1),
+                functools.partial(column_vector, col=col,
+                                  dtype=np.dtype(common.MLParams.features_dtype)),
                 name=col,
                 validate=False))])
 
     def _train_eval(self, x, y, test_ratio, target_name='', baselines=()):
+        if common.MLParams.eval_n_folds > 1:
+            return self._kfold_train_eval(x, y, n_folds=common.MLParams.eval_n_folds,
+                                          target_name=target_name, baselines=baselines)
+
         # split
         x_train, x_test, y_train, y_test, _, test_mask = train_test_split(
             x, y, np.arange(len(y)),
             test_size=test_ratio or common.MLParams.test_ratio,
             shuffle=common.MLParams.shuffle_split
         )
-        self.pipe.fit(x_train, y_train)
-        y_pred = self.predict(x_test)
+        self._fit(x_train, y_train, **self._eval_fit_params)
+        y_pred = self.reg.predict(self.transformer.transform(x_test))
 
         metrics = self.print_metrics(y_test, y_pred, target_name=target_name)
 
         return metrics, self._score_baselines(baselines, test_mask, y_test)
 
     def _score_baselines(self, baselines, test_mask, y_true):
-        return [score_metrics(y_true, vec[test_mask]) for vec in baselines]
+        return [score_metrics(y_true, np.asarray(vec)[test_mask]) for vec in baselines]
+
+    def _kfold_train_eval(self, x, y, n_folds, target_name='', baselines=()):
+        """
+        k-fold evaluation: the folds are fitted in MLParams.eval_n_jobs worker processes
+            that share the transformed features matrix (the transformer is fitted
+            once on all the data, it doesn't use the targets)
+        :return: model and baselines metrics: mean of each metric over the folds,
+            and its std (as '<metric>_std')
+        """
+        folds = list(KFold(n_splits=n_folds,
+                           shuffle=common.MLParams.shuffle_split).split(np.arange(len(y))))
+        x_transformed = self.transformer.fit_transform(x)
+
+        folds_pred = folds_predictions(self.reg, x_transformed, y, folds,
+                                       fit_params=self._eval_fit_params,
+                                       n_jobs=common.MLParams.eval_n_jobs)
+
+        folds_metrics = pd.DataFrame([score_metrics(y[test], y_pred)
+                                      for (_, test), y_pred in zip(folds, folds_pred)])
+        logger.info(f"{target_name}, {n_folds}-fold scores:\n {folds_metrics}")
+        metrics = mean_std_metrics(folds_metrics)
+        logger.info(f"\n {pd.Series(metrics).to_frame(f'{target_name} :').transpose()}")
+
+        baselines_metrics = [
+            mean_std_metrics(pd.DataFrame([score_metrics(y[test], np.asarray(vec)[test])
+                                           for _, test in folds]))
+            for vec in baselines]
+        return metrics, baselines_metrics
+
+    def _fit(self, x, y, **reg_fit_params):
+        """
+        fits the transformer and the regressor of the pipe
+        :return: the transformed x (so that it's not transformed again)
+        """
+        x_transformed = self.transformer.fit_transform(x)
+        self.reg.fit(x_transformed, y, **reg_fit_params)
+        return x_transformed
 
     def _refit(self, x, y):
-        self.pipe.fit(x, y)
+        return self._fit(x, y)
 
     def predict(self, X, **kwargs):
         return self.pipe.predict(X, **kwargs)
@@ -127,55 +260,123 @@ class RegPipelineBase(abc.ABC, LogCallsTimeAndOutput):
                                                       target_name=target_name,
                                                       baselines=baselines)
 
-        self.print_top_n_features(
-            x, y, n=common.InfoParams.top_n_feat, target_name=target_name)
+        x_transformed = self._refit(x, y)
 
-        self._refit(x, y)
+        self.print_top_n_features(
+            x, y, n=common.InfoParams.top_n_feat, target_name=target_name,
+            x_transformed=x_transformed)
 
         return metrics, baselines_metrics
 
     @classmethod
-    def exhaustive_column_selection(cls, text_cols, num_cols, x, y, metric, test_ratio):
-        res = []
-
+    def exhaustive_column_selection(cls, text_cols, num_cols, x, y, metric, test_ratio,
+                                    n_jobs=None):
+        """
+        evaluates the regressor on every subset of the columns on the same
+            train / test split. each column's features are transformed only once
+            and the subsets' features are their hstacked blocks, fitted and scored in
+            n_jobs worker processes (MLParams.column_selection_n_jobs by default)
+        :return: pipeline (unfitted) with the best columns, and the results of
+            all subsets ordered from best to worst
+        """
         x_train, x_test, y_train, y_test = train_test_split(
             x, y,
             test_size=test_ratio or common.MLParams.test_ratio,
             shuffle=common.MLParams.shuffle_split)
 
-        for cols in all_subsets(text_cols + num_cols):
-            this = cls(
-                [col for col in text_cols if col in cols],
-                [col for col in num_cols if col in cols])
-
-            this.pipe.fit(x_train[list(cols)], y_train)
-            y_pred = this.pipe.predict(x_test[list(cols)])
-            test_metrics = score_metrics(y_test, y_pred)
-
-            res.append((test_metrics[metric], cols))
+        # the blocks are in the same order as in a pipeline of any subset
+        transformers = cls(text_cols, num_cols).transformer.transformer_list
+        train_blocks, test_blocks = [], []
+        for _, pipe in transformers:
+            train_blocks.append(scipy.sparse.csr_matrix(pipe.fit_transform(x_train)))
+            test_blocks.append(scipy.sparse.csr_matrix(pipe.transform(x_test)))
+        cols = text_cols + num_cols
+        offsets = np.cumsum([0] + [block.shape[1] for block in train_blocks])
+        spans = {col: np.arange(offsets[i], offsets[i + 1]) for i, col in enumerate(cols)}
+
+        subsets = list(all_subsets(cols))
+        tasks = [np.concatenate([spans[col] for col in subset]) for subset in subsets]
+        x_train = scipy.sparse.hstack(train_blocks, format='csr')
+        x_test = scipy.sparse.hstack(test_blocks, format='csr')
+
+        n_jobs = n_jobs or common.MLParams.column_selection_n_jobs
+        if n_jobs > 1:
+            with SharedCSR(x_train) as shared_train, SharedCSR(x_test) as shared_test, \
+                    ProcessPoolExecutor(max_workers=n_jobs,
+                                        initializer=_init_selection_worker,
+                                        initargs=(cls._reg(), shared_train, y_train,
+                                                  shared_test, y_test)) as pool:
+                subsets_metrics = list(pool.map(_subset_test_metrics, tasks))
+        else:
+            _init_selection_worker(cls._reg(), x_train, y_train, x_test, y_test)
+            subsets_metrics = list(map(_subset_test_metrics, tasks))
 
-            logger.info(
-                f'selection {test_metrics} {(test_metrics[metric], cols)}')
+        results = pd.DataFrame(subsets_metrics)
+        results['cols'] = subsets
+        results = results.sort_values(metric, ascending=False).reset_index(drop=True)
+        logger.info(f'column selection results:\n{results}')
 
-        best_cols = sorted(res)[-1][1]
+        best_cols = results['cols'].iloc[0]
         logger.info(f'best: {best_cols}')
 
-        return cls(
-            [col for col in text_cols if col in best_cols],
-            [col for col in num_cols if col in best_cols])
+        return (cls([col for col in text_cols if col in best_cols],
+                    [col for col in num_cols if col in best_cols]),
+                results)
 
-    def print_top_n_features(self, x, y, n=30, target_name=''):
+    def _vocabularies_vectorizers(self):
+        """ :return: pairs of (text column, fitted vectorizer) that have a vocabulary """
+        vectorizers = [pipe.steps[-1][1] for name, pipe in self.transformer.transformer_list
+                       if name.startswith('tfidf_')]
+        return [(col, vec) for col, vec in zip(self.text_cols, vectorizers)
+                if hasattr(vec, 'vocabulary_')]
+
+    def vocabulary_oov_ratio(self, df):
+        """
+        :return: mean (over documents and text columns) ratio of a document's
+            terms that aren't in the fitted vocabulary (0 for hashed text features)
+        """
+        ratios = []
+        for col, vectorizer in self._vocabularies_vectorizers():
+            analyzer = vectorizer.build_analyzer()
+            for doc in df[col].values:
+                terms = set(analyzer(doc))
+                if terms:
+                    ratios.append(sum(t not in vectorizer.vocabulary_ for t in terms)
+                                  / len(terms))
+        return np.mean(ratios) if ratios else 0.0
+
+    def feature_names(self, x, indices):
+        """
+        :param x: data (only the first row is used to get the transformers' widths)
+        :return: names of the features at indices (in the same format as
+            transformer.get_feature_names()) without listing all the names
+        """
+        transformers = self.transformer.transformer_list
+        offsets = np.cumsum(
+            [0] + [pipe.transform(x.iloc[:1]).shape[1] for _, pipe in transformers])
+        getters = {}
+        names = []
+        for ind in indices:
+            i = np.searchsorted(offsets, ind, side='right') - 1
+            name, pipe = transformers[i]
+            if name not in getters:
+                getters[name] = pipe.feature_name_getter()
+            names.append(f'{name}__{getters[name](ind - offsets[i])}')
+        return np.array(names)
+
+    def print_top_n_features(self, x, y, n=30, target_name='', x_transformed=None):
+        """ :param x_transformed: transformer.transform(x) if already available """
         # names
         if not hasattr(self.reg, 'feature_importances_'):
             logger.error(f"regressor {self.reg} doesn't have 'feature_importances_' attribute")
             return
         top_n_feat = np.argsort(self.reg.feature_importances_)[-n:]
-        feat_names = self.transformer.get_feature_names()
-        top_names = np.array(feat_names)[top_n_feat]
+        top_names = self.feature_names(x, top_n_feat)
 
         # correlations
-        x = self.transformer.transform(x)
-        top_feat_x = x[:, top_n_feat].toarray()
+        if x_transformed is None:
+            x_transformed = self.transformer.transform(x)
+        top_feat_x = x_transformed[:, top_n_feat].toarray()
         cors_mat, _ = scipy.stats.spearmanr(top_feat_x, y.reshape(-1, 1))
         cors_vec = cors_mat[-1, 0:-1]
         non_zeros = top_feat_x.astype(bool).sum(0)
@@ -199,7 +400,7 @@ class RFPipeline(RegPipelineBase):
     def _train_eval(self, x, y, test_ratio, target_name='', baselines=()):
         if not test_ratio:
             # use OOB scores instead test and refit
-            self.pipe.fit(x, y)
+            self._fit(x, y)
             return self.print_metrics(y, self.reg.oob_prediction_, target_name=target_name)
         else:
             return super()._train_eval(x, y, test_ratio=test_ratio,
@@ -208,6 +409,7 @@ class RFPipeline(RegPipelineBase):
 
 class LGBRegressionPipeline(RegPipelineBase):
     objective = 'regression'
+    _eval_fit_params = {'early_stopping': True}
 
     class LGBMRegEarlyStop(LGBMRegressor):
         eval_metric = 'l2'
@@ -237,15 +439,45 @@ class LGBRegressionPipeline(RegPipelineBase):
             objective=cls.objective
         )
 
-    def _train_eval(self, x, y, test_ratio, target_name='', baselines=()):
-        x_train, x_test, y_train, y_test, _, test_mask = train_test_split(
-            x, y, np.arange(len(y)),
-            test_size=test_ratio or common.MLParams.test_ratio,
+    def warm_start(self, df, y_col, n_estimators, target_name=''):
+        """
+        continues boosting from the fitted booster with the already fitted
+            transformer (vocabularies), instead of refitting from scratch.
+            the number of added trees is early stopped on a validation split
+            (which is also used for scoring), and then the trees are added on all the data
+        :param n_estimators: maximal number of trees to add
+        :return: metrics of the warm started model on the validation split
+        """
+        if df[y_col].isnull().sum():
+            raise ValueError('Target column contains nans')
+
+        x = self.transformer.transform(df[self.text_cols + self.num_cols])
+        y = df[y_col].values
+        x_train, x_valid, y_train, y_valid = train_test_split(
+            x, y, test_size=common.MLParams.test_ratio,
             shuffle=common.MLParams.shuffle_split)
-        self.pipe.fit(x_train, y_train, regressor__early_stopping=True)
-        y_pred = self.predict(x_test)
-        metrics = self.print_metrics(y_test, y_pred, target_name=target_name)
-        return metrics, self._score_baselines(baselines, test_mask, y_test)
+
+        init_model = self.reg.booster_
+        init_iterations = init_model.current_iteration()
+        prev_n_estimators = self.reg.n_estimators
+        try:
+            self.reg.n_estimators = n_estimators
+            LGBMRegressor.fit(self.reg, x_train, y_train,
+                              init_model=init_model,
+                              eval_metric=self.reg.eval_metric,
+                              early_stopping_rounds=max(n_estimators // 5, 1),
+                              eval_set=(x_valid, y_valid),
+                              verbose=False)
+            metrics = self.print_metrics(y_valid, self.reg.predict(x_valid),
+                                         target_name=target_name)
+
+            self.reg.n_estimators = max(self.reg.best_iteration_ - init_iterations, 1)
+            logger.info(f'LGBM warm start early stopping: '
+                        f'adding {self.reg.n_estimators} trees')
+            LGBMRegressor.fit(self.reg, x, y, init_model=init_model)
+        finally:
+            self.reg.n_estimators = prev_n_estimators
+        return metrics
 
 
 class LGBProbaRegressionPipeline(LGBRegressionPipeline):
@@ -278,6 +510,78 @@ def score_metrics(y_true, y_pred):
     return metrics
 
 
+def mean_std_metrics(folds_metrics):
+    """ :param folds_metrics: DataFrame of metrics (columns) per fold (rows) """
+    return {**folds_metrics.mean().to_dict(),
+            **folds_metrics.std().add_suffix('_std').to_dict()}
+
+
+def folds_predictions(reg, x, y, folds, fit_params, n_jobs):
+    """
+    fits a clone of the regressor on each fold's train rows of the (transformed) x,
+        in n_jobs processes that share x through memory mapped files if more than one
+    :param folds: pairs of (train indices, test indices)
+    :return: predictions for each fold's test rows
+    """
+    tasks = [(train, test, fit_params) for train, test in folds]
+    if n_jobs > 1:
+        with SharedCSR(x) as shared, \
+                ProcessPoolExecutor(max_workers=n_jobs,
+                                    initializer=_init_folds_worker,
+                                    initargs=(reg, shared, y)) as pool:
+            return list(pool.map(_fold_predictions, tasks))
+    else:
+        _init_folds_worker(reg, x, y)
+        return list(map(_fold_predictions, tasks))
+
+
+_worker_folds_data = None
+
+
+def _init_folds_worker(reg, x, y):
+    # x can be a SharedCSR handle (in worker processes)
+    global _worker_folds_data
+    _worker_folds_data = reg, (x.load() if isinstance(x, SharedCSR) else x), y
+
+
+def _fold_predictions(task):
+    train, test, fit_params = task
+    reg, x, y = _worker_folds_data
+    reg = clone(reg)
+    reg.fit(x[train], y[train], **fit_params)
+    return reg.predict(x[test])
+
+
+def column_values(x, col):
+    # module level (and not lambdas) so that fitted pipelines can be pickled
+    return x[col].values
+
+
+def column_vector(x, col, dtype=None):
+    # same dtype as the text features, so that the FeatureUnion doesn't upcast them
+    vec = x[col].values.reshape(-1, 1)
+    return vec.astype(dtype) if dtype is not None else vec
+
+
+_worker_selection_data = None
+
+
+def _init_selection_worker(reg, x_train, y_train, x_test, y_test):
+    # the matrices can be SharedCSR handles (in worker processes)
+    global _worker_selection_data
+    x_train, x_test = [x.load() if isinstance(x, SharedCSR) else x
+                       for x in (x_train, x_test)]
+    _worker_selection_data = reg, x_train, y_train, x_test, y_test
+
+
+def _subset_test_metrics(feature_indices):
+    # fits a fresh regressor on the features of a columns subset and scores it on the test-set
+    reg, x_train, y_train, x_test, y_test = _worker_selection_data
+    reg = clone(reg)
+    reg.fit(x_train[:, feature_indices], y_train)
+    return score_metrics(y_test, reg.predict(x_test[:, feature_indices]))
+
+
 def all_subsets(arr):
     return itertools.chain(*map(
         lambda i: itertools.combinations(arr, i), range(1, len(arr) + 1)))
@@ -1,12 +1,16 @@
 import datetime
+import hashlib
+import json
 import os
 import subprocess
 
+import numpy as np
 import pandas as pd
 import pandas.errors
 
 from jobs_ranker.config import common
 from jobs_ranker.tasks.configs import TaskConfig
+from jobs_ranker.utils import sqlite_db
 from jobs_ranker.utils.logger import logger
 
 
@@ -75,6 +79,7 @@ class JoraCrawlProcess:
 
 
 class CrawlsFilesDao:
+    _rows_cache = {}  # path: (size, mtime) of the file when its rows were counted, and rows
 
     @classmethod
     def read_scrapy_file(cls, filename):
@@ -83,14 +88,18 @@ class CrawlsFilesDao:
         except pandas.errors.EmptyDataError:
             return pd.DataFrame()
         else:
-            drop_cols = [col for col in df.columns if col.startswith('download_')]
-            df.drop(drop_cols, axis=1, inplace=True, errors='ignore')
+            return cls._prepare_scraped(df, filename)
 
-            df['scraped_file'] = filename
+    @classmethod
+    def _prepare_scraped(cls, df, filename):
+        drop_cols = [col for col in df.columns if col.startswith('download_')]
+        df.drop(drop_cols, axis=1, inplace=True, errors='ignore')
+
+        df['scraped_file'] = filename
 
-            df = cls.add_scrape_order_rank(df)
+        df = cls.add_scrape_order_rank(df)
 
-            return df
+        return df
 
     @classmethod
     def add_scrape_order_rank(cls, df):
@@ -163,7 +172,17 @@ class CrawlsFilesDao:
 
     @classmethod
     def rows_in_file(cls, filepath):
-        return len(cls.read_scrapy_file(filepath))
+        """ counts the rows of the crawl file, or returns the cached count if it's unchanged """
+        stat = os.stat(filepath)
+        file_stat = stat.st_size, stat.st_mtime_ns
+        cached = cls._rows_cache.get(filepath)
+        if cached is None or cached[0] != file_stat:
+            try:
+                rows = len(pd.read_csv(filepath, usecols=[0]))
+            except pandas.errors.EmptyDataError:
+                rows = 0
+            cached = cls._rows_cache[filepath] = file_stat, rows
+        return cached[1]
 
     @classmethod
     def all_crawls_lengths(cls, task_config: TaskConfig):
@@ -176,3 +195,178 @@ class CrawlsFilesDao:
              'is_relevant': [int(cls._is_date_relevant(c, task_config=task_config))
                              for c in all_crawls]}
         ).sort_values('crawl_date')
+
+    @classmethod
+    def crawls_lengths_page(cls, task_config: TaskConfig, offset=0, limit=None,
+                            sort_col=None, ascending=True, date_filter=''):
+        """
+        :param sort_col: one of the all_crawls_lengths columns, None for crawl_date
+        :param date_filter: substring of the crawl dates
+        :return: page of all_crawls_lengths, and the number of the filtered crawls
+        """
+        df = cls.all_crawls_lengths(task_config)
+        if date_filter and len(df):
+            df = df[df['crawl_date'].str.contains(date_filter, regex=False)]
+        df = df.sort_values(sort_col or 'crawl_date', ascending=ascending, kind='mergesort')
+        end = None if limit is None else offset + limit
+        return df.iloc[offset:end], len(df)
+
+
+class CrawlsSqliteDao(CrawlsFilesDao):
+    """
+    crawls in the sqlite database (see utils.sqlite_db): the crawl files (which scrapy
+        keeps writing) are imported when they're new or changed (by size or mtime),
+        so the rows counts are indexed queries and each crawl is read from its own
+        table (with the columns and dtypes of the file) instead of parsing the file
+    """
+    db_path = None
+
+    @classmethod
+    def _conn(cls):
+        return sqlite_db.connection(cls.db_path)
+
+    @staticmethod
+    def _file_stat(path):
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime
+
+    @staticmethod
+    def _rows_table(task_name, path):
+        return 'crawl_' + hashlib.md5(f'{task_name}:{path}'.encode()).hexdigest()
+
+    @classmethod
+    def _synced_rows(cls, task_name, path):
+        """ :return: number of rows of the crawl file, importing it if needed """
+        size, mtime = cls._file_stat(path)
+        saved = cls._conn().execute(
+            'SELECT size, mtime, rows FROM crawls WHERE task = ? AND path = ?',
+            (task_name, path)).fetchone()
+        if saved is not None and saved[:2] == (size, mtime):
+            return saved[2]
+
+        try:
+            df = pd.read_csv(path)
+        except pandas.errors.EmptyDataError:
+            df = pd.DataFrame()
+        rows_table = cls._rows_table(task_name, path)
+        dtypes = {col: str(dtype) for col, dtype in df.dtypes.items()}
+        # the metadata is replaced after the rows, so an interrupted import is redone
+        if len(df.columns):
+            df.to_sql(rows_table, cls._conn(), if_exists='replace', index=False)
+        with cls._conn() as conn:
+            if not len(df.columns):
+                conn.execute(f'DROP TABLE IF EXISTS "{rows_table}"')
+            conn.execute(
+                'INSERT OR REPLACE INTO crawls '
+                '(task, path, crawl_date, size, mtime, rows, rows_table, dtypes) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (task_name, path, cls._crawl_date(path), size, mtime, len(df),
+                 rows_table, json.dumps(dtypes)))
+        logger.info(f'imported {len(df)} rows from {path} into sqlite')
+        return len(df)
+
+    @classmethod
+    def sync(cls, task_config: TaskConfig):
+        """ imports the new or changed crawl files of the task """
+        for path in CrawlsFilesDao.get_crawls(task_config,
+                                              raise_on_missing=False,
+                                              ignore_empty=False,
+                                              filter_relevance_date=False):
+            cls._synced_rows(task_config.name, path)
+
+    @classmethod
+    def get_crawls(cls,
+                   task_config: TaskConfig,
+                   raise_on_missing=True,
+                   ignore_empty=True,
+                   filter_relevance_date=True,
+                   ):
+        cls.sync(task_config)
+        query = 'SELECT path FROM crawls WHERE task = ?'
+        params = [task_config.name]
+        if ignore_empty:
+            query += ' AND size > 0'
+        if filter_relevance_date and task_config.past_scrapes_relevance_date:
+            query += ' AND crawl_date >= ?'
+            params.append(cls._relevance_date(task_config))
+        crawls = [row[0] for row in
+                  cls._conn().execute(query + ' ORDER BY path', params).fetchall()]
+
+        if raise_on_missing and not crawls:
+            raise FileNotFoundError(
+                f'No crawls found for task "{task_config.name}", '
+                f'please run scraping.')
+        return crawls
+
+    @staticmethod
+    def _relevance_date(task_config: TaskConfig):
+        return pd.to_datetime(task_config.past_scrapes_relevance_date).date().isoformat()
+
+    @classmethod
+    def _task_of_path(cls, path):
+        # crawls are in a directory per task
+        return os.path.basename(os.path.dirname(path))
+
+    @classmethod
+    def read_scrapy_file(cls, filename):
+        task_name = cls._task_of_path(filename)
+        if not cls._synced_rows(task_name, filename):
+            return pd.DataFrame()
+        rows_table, dtypes = cls._conn().execute(
+            'SELECT rows_table, dtypes FROM crawls WHERE task = ? AND path = ?',
+            (task_name, filename)).fetchone()
+        df = pd.read_sql_query(f'SELECT * FROM "{rows_table}" ORDER BY rowid', cls._conn())
+        df = cls._restore_dtypes(df, json.loads(dtypes))
+        return cls._prepare_scraped(df, filename)
+
+    @staticmethod
+    def _restore_dtypes(df, dtypes):
+        """ :return: df with the dtypes and the missing values of the csv file """
+        # all-null columns are read as None objects, and missing strings as None
+        df = df.astype(dtypes)
+        for col in df.columns[df.dtypes == object]:
+            df[col] = df[col].where(df[col].notnull(), np.nan)
+        return df
+
+    @classmethod
+    def rows_in_file(cls, filepath):
+        return cls._synced_rows(cls._task_of_path(filepath), filepath)
+
+    @classmethod
+    def all_crawls_lengths(cls, task_config: TaskConfig):
+        cls.sync(task_config)
+        df = pd.read_sql_query(
+            'SELECT path, crawl_date, rows FROM crawls WHERE task = ? AND size > 0 '
+            'ORDER BY crawl_date',
+            cls._conn(), params=(task_config.name,))
+        df['is_relevant'] = [int(cls._is_date_relevant(c, task_config=task_config))
+                             for c in df['path']]
+        return df.drop(columns='path')
+
+    @classmethod
+    def crawls_lengths_page(cls, task_config: TaskConfig, offset=0, limit=None,
+                            sort_col=None, ascending=True, date_filter=''):
+        cls.sync(task_config)
+        where = 'task = :task AND size > 0'
+        if date_filter:
+            where += ' AND instr(crawl_date, :date_filter) > 0'
+        order = {'rows': 'rows', 'is_relevant': 'is_relevant'}.get(sort_col, 'crawl_date')
+        params = dict(task=task_config.name, date_filter=date_filter,
+                      relevance_date=cls._relevance_date(task_config),
+                      limit=-1 if limit is None else limit, offset=offset)
+        total = cls._conn().execute(
+            f'SELECT COUNT(*) FROM crawls WHERE {where}', params).fetchone()[0]
+        df = pd.read_sql_query(
+            f'SELECT crawl_date, rows, CAST(crawl_date >= :relevance_date AS INTEGER) '
+            f'AS is_relevant FROM crawls WHERE {where} '
+            f'ORDER BY {order} {"ASC" if ascending else "DESC"}, crawl_date '
+            f'LIMIT :limit OFFSET :offset',
+            cls._conn(), params=params)
+        return df, total
+
+
+def crawls_dao():
+    """ :return: crawls DAO of the configured storage backend (StorageParams.backend) """
+    if common.StorageParams.backend == 'sqlite':
+        return CrawlsSqliteDao
+    return CrawlsFilesDao
@@ -48,6 +48,31 @@ class TaskConfig(dict):
         os.makedirs(path, exist_ok=True)
         return path
 
+    @property
+    def dedup_index_path(self):
+        return os.path.join(common.DEDUP_INDEX_DIR, f'{self.name}.pkl')
+
+    def features_cache_path(self, kind):
+        return os.path.join(common.FEATURES_CACHE_DIR, f'{self.name}-{kind}.pkl')
+
+    def model_path(self, kind):
+        return os.path.join(common.MODELS_DIR, f'{self.name}-{kind}.pkl')
+
+    @property
+    def label_columns_path(self):
+        return os.path.join(common.MODELS_DIR, f'{self.name}-label-columns.json')
+
+    @property
+    def label_columns(self):
+        """
+        columns selection for the label model (saved by column selection next to
+            the models, so it's not part of the task's data and isn't copied to new tasks)
+        """
+        if not os.path.exists(self.label_columns_path):
+            return None
+        with open(self.label_columns_path, 'rt') as f:
+            return json.load(f)
+
     def data_dict(self):
         copy = self.copy()
         copy.pop('_name')
@@ -121,6 +146,13 @@ class TasksConfigsDao:
         orig_config.update(updated_config)
         cls._save(config=orig_config)
 
+    @classmethod
+    def save_label_columns(cls, config: TaskConfig, label_columns):
+        temp_path = config.label_columns_path + '.tmp'
+        with open(temp_path, 'wt') as f:
+            json.dump(label_columns, f)
+        os.replace(temp_path, config.label_columns_path)
+
     @classmethod
     def _validate_new_name(cls, name):
         name = name.lower()
@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import scipy.sparse
+
+
+class SharedCSR:
+    """
+    CSR matrix dumped into memory mapped .npy files, so that it can be passed to
+    worker processes (only the small handle is pickled) and loaded by them
+    without copying the buffers into each process.
+    use as a context manager to remove the files when done.
+    """
+    _parts = ['data', 'indices', 'indptr']
+
+    def __init__(self, matrix):
+        matrix = scipy.sparse.csr_matrix(matrix)
+        self.shape = matrix.shape
+        self.dir = tempfile.mkdtemp(prefix='shared_csr_')
+        for part in self._parts:
+            np.save(self._part_path(part), getattr(matrix, part))
+
+    def _part_path(self, part):
+        return os.path.join(self.dir, f'{part}.npy')
+
+    def load(self):
+        data, indices, indptr = [np.load(self._part_path(part), mmap_mode='r')
+                                 for part in self._parts]
+        return scipy.sparse.csr_matrix(
+            (data, indices, indptr), shape=self.shape, copy=False)
+
+    def cleanup(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.cleanup()
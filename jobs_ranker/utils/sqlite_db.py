@@ -0,0 +1,59 @@
+import sqlite3
+import threading
+
+from jobs_ranker.config import common
+
+SCHEMA = [
+    # last label of each url (replacing a label re-inserts it, so ids are in labeling order)
+    'CREATE TABLE IF NOT EXISTS labels ('
+    'id INTEGER PRIMARY KEY, task TEXT NOT NULL, url TEXT NOT NULL, '
+    'label TEXT NOT NULL, timestamp TEXT, UNIQUE (task, url))',
+
+    'CREATE TABLE IF NOT EXISTS dup_groups ('
+    'task TEXT NOT NULL, url TEXT NOT NULL, group_id INTEGER NOT NULL, '
+    'PRIMARY KEY (task, url))',
+    'CREATE INDEX IF NOT EXISTS dup_groups_group ON dup_groups (task, group_id)',
+
+    # crawl files metadata (size and mtime of the file when its rows were imported),
+    # the rows of each crawl are in its own table (the crawls' columns can differ)
+    # with the columns' dtypes of the file as json
+    'CREATE TABLE IF NOT EXISTS crawls ('
+    'task TEXT NOT NULL, path TEXT NOT NULL, crawl_date TEXT NOT NULL, '
+    'size INTEGER NOT NULL, mtime REAL NOT NULL, rows INTEGER NOT NULL, '
+    'rows_table TEXT NOT NULL, dtypes TEXT NOT NULL, '
+    'PRIMARY KEY (task, path))',
+    'CREATE INDEX IF NOT EXISTS crawls_date ON crawls (task, crawl_date)',
+]
+
+# bump when the schema changes incompatibly, MIGRATIONS[version] are run when upgrading
+# from that version (the crawls tables can be dropped, they are re-imported from the files)
+SCHEMA_VERSION = 1
+MIGRATIONS = {
+    # new database, or with the crawls' rows as json in a single jobs table
+    0: ['DROP TABLE IF EXISTS jobs', 'DROP TABLE IF EXISTS crawls'],
+}
+
+_local = threading.local()
+
+
+def connection(path=None):
+    """
+    :return: connection (one per thread and path) to the sqlite database
+        in WAL mode (readers don't block the writer and vice versa), with the schema
+    """
+    path = path or common.SQLITE_PATH
+    connections = _local.__dict__.setdefault('connections', {})
+    if path not in connections:
+        conn = sqlite3.connect(path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        with conn:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version < SCHEMA_VERSION:
+                for statement in MIGRATIONS[version]:
+                    conn.execute(statement)
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        connections[path] = conn
+    return connections[path]
@@ -1,3 +1,5 @@
+import json
+
 import flask
 
 from jobs_ranker.tasks import configs
@@ -215,6 +217,20 @@ def recalc(task_name):
     return flask.redirect(flask.url_for('labeling', task_name=task_name))
 
 
+@app.route('/<task_name>/label/select_columns/')
+def select_columns(task_name):
+    task = tasks[task_name]
+    if not task.ranker.loaded:
+        flask.flash(f'Data is not loaded yet for task "{task_name}", '
+                    f'not selecting columns.', 'warning')
+    else:
+        task.select_columns()
+        logger.info(f'selecting label model columns: {task_name}')
+        flask.flash(f'selecting label model columns in the background for task '
+                    f'"{task_name}" (used from next recalc when done)', 'info')
+    return flask.redirect(flask.url_for('task_description', task_name=task_name))
+
+
 @app.route('/<task_name>/reload/')
 def reload_ranker(task_name):
     task = tasks[task_name]
@@ -267,18 +283,98 @@ def scrape_start(task_name):
     return flask.redirect(flask.url_for('scraping', task_name=task_name))
 
 
+class HistoryPage:
+    """ pagination, sorting and filtering of a history table from the request args """
+    default_per_page = 100
+    max_per_page = 1000
+
+    def __init__(self, endpoint, task_name, columns, default_sort, filter_col):
+        self.endpoint = endpoint
+        self.task_name = task_name
+        self.columns = columns
+        self.filter_col = filter_col
+        args = flask.request.args
+        self.page = max(args.get('page', 1, type=int), 1)
+        self.per_page = min(max(args.get('per_page', self.default_per_page, type=int), 1),
+                            self.max_per_page)
+        self.sort = args.get('sort', default_sort)
+        if self.sort not in columns:
+            self.sort = default_sort
+        self.order = 'asc' if args.get('order') == 'asc' else 'desc'
+        self.query = args.get('q', '')
+
+    def page_kwargs(self):
+        return dict(offset=(self.page - 1) * self.per_page,
+                    limit=self.per_page,
+                    sort_col=self.sort,
+                    ascending=self.order == 'asc')
+
+    def url(self, json=False, **changes):
+        args = dict(page=self.page, per_page=self.per_page,
+                    sort=self.sort, order=self.order, q=self.query)
+        args.update(changes)
+        return flask.url_for(f'{self.endpoint}_json' if json else self.endpoint,
+                             task_name=self.task_name, **args)
+
+    def json_response(self, df, total):
+        return flask.jsonify(
+            total=total, page=self.page, per_page=self.per_page, columns=self.columns,
+            sort=self.sort, order=self.order, q=self.query,
+            rows=json.loads(df.to_json(orient='records', date_format='iso')))
+
+    def html_response(self, df, total, title, link_cols=(), gradient_col=None):
+        # the table is streamed as it's rendered
+        context = dict(task_name=self.task_name, title=title, history=self,
+                       rows=(row for row in df.to_dict('records')), total=total,
+                       n_pages=max(-(-total // self.per_page), 1),
+                       link_cols=link_cols, gradient_col=gradient_col)
+        app.update_template_context(context)
+        stream = app.jinja_env.get_template('history_table.html').stream(context)
+        stream.enable_buffering(20)
+        return flask.Response(flask.stream_with_context(stream))
+
+
+def _labels_history_page(task_name):
+    history = HistoryPage('labels_history', task_name,
+                          columns=['url', 'label', 'timestamp'],
+                          default_sort='timestamp', filter_col='url')
+    df, total = tasks[task_name].labels_history_page(
+        url_filter=history.query, **history.page_kwargs())
+    return history, df, total
+
+
 @app.route('/<task_name>/labels_history')
 def labels_history(task_name):
-    return flask.render_template(
-        'rawtext_or_html.html',
-        html=tasks[task_name].labels_history_table())
+    history, df, total = _labels_history_page(task_name)
+    return history.html_response(df, total, title='labels history',
+                                 link_cols=['url'], gradient_col='label')
+
+
+@app.route('/<task_name>/labels_history.json')
+def labels_history_json(task_name):
+    history, df, total = _labels_history_page(task_name)
+    return history.json_response(df, total)
+
+
+def _scrapes_history_page(task_name):
+    history = HistoryPage('scrapes_history', task_name,
+                          columns=['crawl_date', 'rows', 'is_relevant'],
+                          default_sort='crawl_date', filter_col='crawl_date')
+    df, total = tasks[task_name].crawls_lengths_page(
+        date_filter=history.query, **history.page_kwargs())
+    return history, df, total
 
 
 @app.route('/<task_name>/scrapes_history')
 def scrapes_history(task_name):
-    table = tasks[task_name].all_crawls_lengths().to_html(
-        index=False, classes="table-sm table-bordered table-hover table-striped")
-    return flask.render_template('rawtext_or_html.html', html=table)
+    history, df, total = _scrapes_history_page(task_name)
+    return history.html_response(df, total, title='scrapes history')
+
+
+@app.route('/<task_name>/scrapes_history.json')
+def scrapes_history_json(task_name):
+    history, df, total = _scrapes_history_page(task_name)
+    return history.json_response(df, total)
 
 
 @app.route('/log')
@@ -5,8 +5,8 @@ from multiprocessing import Process
 
 import flask
 
-from jobs_ranker.joblist.labeled import labels_history_table
-from jobs_ranker.scraping.crawling import CrawlsFilesDao, JoraCrawlProcess
+from jobs_ranker.joblist.labeled import labels_history_page
+from jobs_ranker.scraping.crawling import JoraCrawlProcess, crawls_dao
 from jobs_ranker.joblist import ranking
 from jobs_ranker.tasks.configs import TasksConfigsDao
 
@@ -49,8 +49,8 @@ class TaskSession:
             self.reset_session_state()
         return self._ranker
 
-    def labels_history_table(self):
-        return labels_history_table(task_name=self.task_name)
+    def labels_history_page(self, **page_kwargs):
+        return labels_history_page(task_name=self.task_name, **page_kwargs)
 
     @raise_404_on_filenotfound
     def load_ranker(self):
@@ -84,6 +84,9 @@ class TaskSession:
         self.ranker.rerank_jobs(background=True)
         self.reset_session_state()
 
+    def select_columns(self):
+        self.ranker.select_label_columns(background=True)
+
     def skip(self, url):
         self._skipped.add(url)
         self._cur_urls.discard(url)
@@ -103,17 +106,17 @@ class TaskSession:
                 self._crawl_subproc.is_alive())
 
     def days_since_last_crawl(self):
-        return CrawlsFilesDao.days_since_last_crawl(self.get_config())
+        return crawls_dao().days_since_last_crawl(self.get_config())
 
     def jobs_in_latest_crawl(self):
         if (self._crawler.crawl_output_path and
                 os.path.exists(self._crawler.crawl_output_path)):
-            return CrawlsFilesDao.rows_in_file(self._crawler.crawl_output_path)
+            return crawls_dao().rows_in_file(self._crawler.crawl_output_path)
         else:
             return 0
 
-    def all_crawls_lengths(self):
-        return CrawlsFilesDao.all_crawls_lengths(self.get_config())
+    def crawls_lengths_page(self, **page_kwargs):
+        return crawls_dao().crawls_lengths_page(self.get_config(), **page_kwargs)
 
     def expected_jobs_per_crawl(self):
         return (len(self.get_config().search_urls) *
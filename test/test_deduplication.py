@@ -0,0 +1,139 @@
+import numpy as np
+import pytest
+
+from jobs_ranker.benchmarks.dedup import _pairs_set
+from jobs_ranker.benchmarks.synthetic import SyntheticJobAds
+from jobs_ranker.config import common
+from jobs_ranker.ml import deduplication
+
+THRESHOLD = 0.5
+
+
+@pytest.fixture(scope='module')
+def strings():
+    return SyntheticJobAds(seed=0).corpus(300)['description'].values.astype(str)
+
+
+@pytest.fixture(scope='module')
+def vecs(strings):
+    return deduplication._tfidf_vectors(strings)
+
+
+@pytest.fixture(scope='module')
+def exact_pairs(vecs):
+    simil = (vecs @ vecs.T).toarray()
+    np.fill_diagonal(simil, 0)
+    return _pairs_set(*np.where(simil > THRESHOLD))
+
+
+def test_minhash_lsh_pairs_are_verified_exact_pairs(vecs, exact_pairs):
+    signatures, signed_rows = deduplication.minhash_signatures(vecs, n_perm=128)
+    pairs = _pairs_set(*deduplication.verified_lsh_pairs(vecs, signatures, signed_rows))
+    assert exact_pairs
+    assert pairs <= exact_pairs
+    assert len(pairs) >= 0.95 * len(exact_pairs)
+
+
+def test_minhash_signatures_skip_empty_rows(vecs):
+    vecs = vecs[:5].tolil()
+    vecs[2] = 0
+    signatures, rows = deduplication.minhash_signatures(vecs.tocsr(), n_perm=16)
+    assert rows.tolist() == [0, 1, 3, 4]
+    assert signatures.shape == (4, 16)
+
+
+def test_minhash_signatures_deterministic(vecs):
+    first, _ = deduplication.minhash_signatures(vecs, n_perm=32)
+    second, _ = deduplication.minhash_signatures(vecs, n_perm=32)
+    assert (first == second).all()
+
+
+def test_minhash_backend_same_pairs_as_tfidf(strings, monkeypatch):
+    monkeypatch.setattr(common.MLParams, 'dedup_simil_thershold', THRESHOLD)
+    lsh_pairs = _pairs_set(*deduplication.duplicates_by_minhash_lsh(strings))
+    tfidf_pairs = _pairs_set(*deduplication.duplicates_by_tfidf_cosine(strings))
+    assert lsh_pairs <= tfidf_pairs
+    assert len(lsh_pairs) >= 0.95 * len(tfidf_pairs)
+
+
+def _footer_corpus():
+    rand = np.random.RandomState(0)
+    words = np.array([f'word{i}' for i in range(20000)])
+    footer = 'apply now through acme recruitment agency partners limited sydney office'
+    base = [' '.join(rand.choice(words[:5000], 80)) for _ in range(300)]
+    base[:10] = [doc + ' ' + footer for doc in base[:10]]
+    # unrelated new documents with words that are not in the base documents
+    new = [' '.join(rand.choice(words[10000:], 80)) + ' ' + footer for _ in range(2)]
+    return np.array(base), np.array(new)
+
+
+@pytest.fixture
+def dedup_index(tmp_path, monkeypatch):
+    monkeypatch.setattr(common.MLParams, 'dedup_method', 'tfidf_cosine')
+    monkeypatch.setattr(common.MLParams, 'dedup_n_jobs', 1)
+    return deduplication.DedupIndex(str(tmp_path / 'index.pkl'))
+
+
+def test_dedup_index_rebuild_same_as_full(dedup_index, strings):
+    keys = np.arange(len(strings)).astype(str)
+    dedup_index.update(keys, strings)
+    assert (_pairs_set(*dedup_index.duplicates(keys)) ==
+            _pairs_set(*deduplication.duplicates_by_tfidf_cosine(strings)))
+
+
+def test_dedup_index_known_terms_vectors_same_as_vectorizer(dedup_index, strings):
+    keys = np.arange(len(strings)).astype(str)
+    dedup_index.update(keys[:200], strings[:200])
+    vectorizer = deduplication._tfidf_vectorizer(200).fit(strings[:200])
+    expected = vectorizer.transform(strings[:50])
+    actual = dedup_index._transform(strings[:50])
+    assert abs(actual[:, :expected.shape[1]] - expected).max() == 0
+
+
+def test_dedup_index_new_documents_with_shared_footer(dedup_index, monkeypatch):
+    monkeypatch.setattr(common.MLParams, 'dedup_index_refit_ratio', 1.0)
+    base, new = _footer_corpus()
+    strings = np.concatenate([base, new])
+    keys = np.arange(len(strings)).astype(str)
+    dedup_index.update(keys[:len(base)], base)
+    dedup_index.update(keys, strings)
+    assert dedup_index.n_fitted == len(base)  # incremental, not rebuilt
+    assert _pairs_set(*deduplication.duplicates_by_tfidf_cosine(strings)) == set()
+    assert _pairs_set(*dedup_index.duplicates(keys)) == set()
+
+
+def test_dedup_index_new_duplicates_and_subset_of_keys(dedup_index, strings, monkeypatch):
+    monkeypatch.setattr(common.MLParams, 'dedup_index_refit_ratio', 1.0)
+    keys = np.arange(len(strings)).astype(str)
+    dedup_index.update(keys[:250], strings[:250])
+    # exact copies of documents as new documents
+    copies = np.concatenate([strings, strings[:5]])
+    copies_keys = np.concatenate([keys, ['copy0', 'copy1', 'copy2', 'copy3', 'copy4']])
+    dedup_index.update(copies_keys, copies)
+    pairs = _pairs_set(*dedup_index.duplicates(copies_keys))
+    assert {(i, len(strings) + i) for i in range(5)} <= pairs
+
+    # only the pairs between the requested keys, in their positions
+    subset = copies_keys[[len(strings), 0, 1]]
+    assert (0, 1) in _pairs_set(*dedup_index.duplicates(subset))
+
+
+def test_similar_pairs_chunked_same_as_dense(vecs, exact_pairs):
+    dup_i, dup_j = deduplication.similar_pairs_chunked(vecs, threshold=THRESHOLD,
+                                                       chunk_size=37)
+    assert _pairs_set(dup_i, dup_j) == exact_pairs
+    assert len(dup_i) == 2 * len(exact_pairs)  # symmetric
+
+
+@pytest.mark.parametrize('start_row', [0, 120])
+def test_similar_pairs_parallel_same_as_chunked(vecs, start_row):
+    expected = deduplication.similar_pairs_chunked(
+        vecs, threshold=THRESHOLD, chunk_size=37, start_row=start_row)
+    actual = deduplication.similar_pairs_parallel(
+        vecs, threshold=THRESHOLD, chunk_size=37, n_jobs=2, start_row=start_row)
+    expected_pairs = set(zip(*expected))
+    # the parallel pairs are in both directions (also when start_row > 0)
+    assert set(zip(*actual)) == expected_pairs | {(j, i) for i, j in expected_pairs}
+    if start_row == 0:
+        assert np.array_equal(expected[0], actual[0])
+        assert np.array_equal(expected[1], actual[1])
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from jobs_ranker.benchmarks.features import _extract_numeric_fields_reference, \
+    assert_frames_equal
+from jobs_ranker.joblist import features
+
+NUMERIC_COLS = ['description', 'description_length', 'salary_low', 'salary_high',
+                'days_age', 'years_exp_max']
+
+
+def _fixture_df():
+    return pd.DataFrame({
+        'description': [
+            'Senior Engineer\nrequires 5 years of python',
+            'at least 3+ years\twith 4 years or 12 years with sql',
+            'a 15 years old company, no experience needed',
+            np.nan,
+            'Graduate role, 2 YEARS of study',
+            'nothing numeric here',
+        ],
+        'salary': ['$100,000 - $120,000 a year', '$500 - $600 a day', '$50 - $60 an hour',
+                   np.nan, '$90,000 a year', 'competitive'],
+        'date': ['3 days ago', '2 months ago', '5 hours ago', np.nan, 'today', '1 day ago'],
+    }, index=[10, 3, 7, 0, 22, 5])  # scraped frames don't have a range index
+
+
+def test_extract_numeric_fields_same_as_row_wise():
+    df = _fixture_df()
+    expected = _extract_numeric_fields_reference(df.copy())
+    actual = features.extract_numeric_fields(df.copy())
+    assert_frames_equal(expected, actual, columns=NUMERIC_COLS)
+    assert actual.index.equals(df.index)
+
+
+def test_extract_numeric_fields_values():
+    actual = features.extract_numeric_fields(_fixture_df())
+    assert actual['salary_low'].tolist()[:3] == [100000.0, 100000.0, 80000.0]
+    assert actual['salary_high'].tolist()[:3] == [120000.0, 120000.0, 96000.0]
+    assert actual['days_age'].tolist()[:3] == [3, 60, 0]
+    assert actual['years_exp_max'].tolist() == [5, 4, 0, 0, 2, 0]
+
+
+def test_years_experience_int64():
+    descriptions = features.normalized_descriptions(_fixture_df()['description'])
+    years = features.years_experience(descriptions)
+    assert years.dtype == np.int64
+    assert years.index.equals(descriptions.index)
+    assert years.tolist() == [5, 4, 0, 0, 2, 0]
+
+
+def test_years_experience_without_matches():
+    years = features.years_experience(pd.Series(['no years', 'none'], index=[4, 2]))
+    assert years.dtype == np.int64
+    assert years.tolist() == [0, 0]